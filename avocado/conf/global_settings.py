@@ -63,3 +63,47 @@ INTERNAL_DATATYPE_FORMFIELDS = {
     'smallinteger': 'FloatField',
 }
 
+
+# the maximum number of compiled query trees kept in the process-wide query
+# cache and the number of seconds each entry is valid for. set the size to
+# zero to disable the cache
+QUERY_CACHE_SIZE = 500
+
+QUERY_CACHE_TIMEOUT = 60 * 60
+
+# the maximum number of query strings, i.e. the lookup paths from the root
+# model of a modeltree to a field, kept in the process-wide cache
+QUERY_STRING_CACHE_SIZE = 2000
+
+# the maximum number of definitions whose distinct values and choices are
+# kept in the process-wide choices cache and the number of seconds each
+# entry is valid for. set the size to zero to disable the cache
+CHOICES_CACHE_SIZE = 100
+
+CHOICES_CACHE_TIMEOUT = 60 * 60
+
+# ``in`` conditions with more values than this are compiled into a subquery
+# over a single parameter containing the values, i.e. an array expanded using
+# ``unnest`` on PostgreSQL and a JSON array expanded using ``json_each`` on
+# SQLite 3.38 or later. other databases always use a parameter per value.
+# set to ``None`` to disable
+LARGE_IN_LIST_THRESHOLD = 1000
+
+# the backend used to cache the result counts of query trees. the builtin
+# backends are ``avocado.meta.counts.LocalBackend``, a per-process cache
+# which is only invalidated in the process loading the data, and
+# ``avocado.meta.counts.DjangoBackend`` which uses Django's cache framework
+# and should be used with a shared cache for multiple processes. set to
+# ``None`` to disable the cache
+COUNT_CACHE_BACKEND = 'avocado.meta.counts.LocalBackend'
+
+# the maximum number of counts kept by the ``LocalBackend`` and the number
+# of seconds each count is valid for
+COUNT_CACHE_SIZE = 1000
+
+COUNT_CACHE_TIMEOUT = 60 * 5
+
+# simplify query trees prior to building the conditions, e.g. merging
+# multiple ``exact`` conditions for the same field in an OR into an ``in``
+# condition. the ``text`` of the tree is not affected
+OPTIMIZE_QUERY_TREES = False
@@ -4,10 +4,13 @@ from django.core.management import call_command
 class Command(BaseCommand):
     help = "A wrapper for Avocado subcommands"
 
-    commands = ['sync', 'orphaned']
+    commands = ['sync', 'orphaned', 'distributions', 'fingerprints',
+        'profile-startup']
 
     def handle(self, *args, **options):
         if not args or args[0] not in self.commands:
             return self.print_help('./manage.py', 'avocado')
-        return call_command(*args, **options)
+        # command modules cannot contain hyphens
+        name = args[0].replace('-', '_')
+        return call_command(name, *args[1:], **options)
 
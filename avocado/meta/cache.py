@@ -0,0 +1,330 @@
+import hashlib
+from bisect import bisect_left
+from django import forms
+from django.db import models
+from django.db.models.fields import FieldDoesNotExist
+from django.utils.encoding import smart_unicode
+from django.utils.importlib import import_module
+
+from avocado.conf import settings
+from avocado.utils.cache import LRUCache
+
+INTERNAL_DATATYPE_MAP = settings.INTERNAL_DATATYPE_MAP
+DATATYPE_OPERATOR_MAP = settings.DATATYPE_OPERATOR_MAP
+INTERNAL_DATATYPE_FORMFIELDS = settings.INTERNAL_DATATYPE_FORMFIELDS
+DATA_CHOICES_MAP = settings.DATA_CHOICES_MAP
+
+# the operators allowed per datatype for fields that are and are not
+# nullable. the tuples preserve the order for clients, the frozensets are
+# used for validation
+OPERATOR_TABLE = {}
+
+for datatype, operators in DATATYPE_OPERATOR_MAP.iteritems():
+    nullable = operators + ('isnull', '-isnull')
+    OPERATOR_TABLE[(datatype, False)] = (operators, frozenset(operators))
+    OPERATOR_TABLE[(datatype, True)] = (nullable, frozenset(nullable))
+
+def get_form_class(name):
+    # infers this is a path
+    if '.' in name:
+        path = name.split('.')
+        name = path.pop()
+        mod = import_module('.'.join(path))
+    # use the django forms module
+    else:
+        if not name.endswith('Field'):
+            name = name + 'Field'
+        mod = forms
+    return getattr(mod, name)
+
+def get_internal_type(field):
+    "Returns the internal type of the field without the trailing 'field'."
+    datatype = field.get_internal_type().lower()
+    # trim 'field' off the end
+    if datatype.endswith('field'):
+        datatype = datatype[:-5]
+    return datatype
+
+
+def get_fingerprint(field):
+    """Returns a hash of the properties of the field which the metadata is
+    derived from, i.e. the type, nullability, max length and choices.
+    """
+    choices = [(smart_unicode(k), smart_unicode(v)) for k, v in
+        field.flatchoices]
+    raw = repr((get_internal_type(field), field.null, field.max_length,
+        choices))
+    return hashlib.sha1(raw).hexdigest()
+
+
+class Metadata(object):
+    """The resolved model metadata for a single natural key. If the model or
+    field no longer exists, the remaining attributes will be ``None``.
+
+        ``model`` - the model class
+
+        ``field`` - the model field instance
+
+        ``internal_type`` - the field's internal type, e.g. ``char``
+
+        ``datatype`` - the client-friendly datatype as defined by the
+        ``INTERNAL_DATATYPE_MAP`` setting
+
+        ``operators`` - the tuple of operators allowed for the datatype
+
+        ``allowed_operators`` - a frozenset of ``operators`` for validation
+
+        ``form_class`` - the formfield class override defined by the
+        ``INTERNAL_DATATYPE_FORMFIELDS`` setting
+
+        ``validators`` - the compiled value validators per translator, see
+        ``Translator.get_validator``
+
+        ``fingerprint`` - a hash of the field properties, see
+        ``get_fingerprint``
+    """
+    def __init__(self, app_name, model_name, field_name):
+        self.model = models.get_model(app_name, model_name)
+        self.validators = {}
+
+        self.field = None
+        self.internal_type = None
+        self.datatype = None
+        self.operators = None
+        self.allowed_operators = None
+        self.form_class = None
+        self.fingerprint = None
+
+        if self.model is None:
+            return
+
+        try:
+            self.field = self.model._meta.get_field_by_name(field_name)[0]
+        except FieldDoesNotExist:
+            return
+
+        self.internal_type = get_internal_type(self.field)
+        self.fingerprint = get_fingerprint(self.field)
+
+        # if a mapping exists, replace the datatype
+        self.datatype = INTERNAL_DATATYPE_MAP.get(self.internal_type,
+            self.internal_type)
+
+        # the ``isnull`` operator is a special case since all datatypes can
+        # be nullable. this merely checks to see if the field allows null
+        # values.
+        key = (self.datatype, bool(self.field.null))
+
+        if key in OPERATOR_TABLE:
+            self.operators, self.allowed_operators = OPERATOR_TABLE[key]
+        elif self.field.null:
+            self.operators = ('isnull', '-isnull')
+            self.allowed_operators = frozenset(self.operators)
+        else:
+            self.operators = ()
+            self.allowed_operators = frozenset()
+
+        if self.internal_type in INTERNAL_DATATYPE_FORMFIELDS:
+            name = INTERNAL_DATATYPE_FORMFIELDS[self.internal_type]
+            self.form_class = get_form_class(name)
+
+
+class MetadataCache(object):
+    """Process-wide cache of the resolved model metadata keyed by the
+    ``Definition`` natural key, i.e. ``(app_name, model_name, field_name)``.
+    Entries are invalidated when the corresponding ``Definition`` is saved or
+    deleted.
+    """
+    def __init__(self):
+        self._cache = {}
+
+    def __contains__(self, key):
+        return tuple(key) in self._cache
+
+    def __len__(self):
+        return len(self._cache)
+
+    def get(self, key):
+        "Returns the ``Metadata`` for the natural key, resolving it if needed."
+        key = tuple(key)
+        if key not in self._cache:
+            self._cache[key] = Metadata(*key)
+        return self._cache[key]
+
+    def warm(self, definitions=None):
+        """Resolves the metadata for all ``definitions`` (all Definitions by
+        default) in a single pass. This should be called at startup.
+        """
+        if definitions is None:
+            from avocado.meta.models import Definition
+            definitions = Definition.objects.all()
+
+        keys = definitions.values_list('app_name', 'model_name', 'field_name')
+
+        for key in keys:
+            self.get(key)
+
+    def invalidate(self, key=None):
+        "Invalidates a single natural key or the whole cache."
+        if key is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(tuple(key), None)
+
+
+metadata = MetadataCache()
+
+
+class QueryStringCache(object):
+    """Bounded cache of the query strings resolved by the modeltree, keyed by
+    ``(app_name, model_name, field_name, operator, using)``. The entries for
+    a modeltree alias are cleared when the modeltree is rebuilt, i.e. when
+    ``trees[using]`` returns a different tree.
+    """
+    def __init__(self, maxsize=None):
+        self._cache = LRUCache(maxsize)
+        self._trees = {}
+
+    def __len__(self):
+        return len(self._cache)
+
+    def get(self, app_name, model_name, field_name, operator=None,
+        using=None):
+        # imported here to keep modeltree out of the startup cost until the
+        # first query string is requested
+        from modeltree.tree import trees
+
+        tree = trees[using]
+
+        if self._trees.get(using) is not tree:
+            self.invalidate(using)
+            self._trees[using] = tree
+
+        key = (app_name, model_name, field_name, operator, using)
+        query_string = self._cache.get(key)
+
+        if query_string is None:
+            field = metadata.get(key[:3]).field
+            query_string = tree.query_string_for_field(field,
+                operator=operator)
+
+            if self._cache.maxsize != 0:
+                self._cache.set(key, query_string)
+
+        return query_string
+
+    def invalidate(self, using=None):
+        "Invalidates the entries for a modeltree alias."
+        for key, value in self._cache.items():
+            if key[-1] == using:
+                self._cache.delete(key)
+
+    def clear(self):
+        self._cache.clear()
+        self._trees.clear()
+
+    @property
+    def stats(self):
+        return self._cache.stats
+
+
+query_strings = QueryStringCache(settings.QUERY_STRING_CACHE_SIZE)
+
+
+class ChoicesIndex(object):
+    """The distinct values of a definition and their labels. The labels are
+    indexed for case-insensitive prefix searches.
+    """
+    def __init__(self, values):
+        self.values = tuple(values)
+        # iterate over each value and attempt to get the mapped choice
+        # other fallback to the value itself
+        self.choices = tuple((v, smart_unicode(DATA_CHOICES_MAP.get(v, v)))
+            for v in self.values)
+
+        self._values = frozenset(self.values)
+        self._labels = sorted((label.lower(), i) for i, (value, label)
+            in enumerate(self.choices))
+        self._keys = [key for key, i in self._labels]
+
+    def __contains__(self, value):
+        return value in self._values
+
+    def __len__(self):
+        return len(self.values)
+
+    def page(self, page=1, per_page=20):
+        "Returns the choices for the one-based ``page``."
+        start = (page - 1) * per_page
+        return self.choices[start:start + per_page]
+
+    def search(self, prefix, limit=None):
+        """Returns the choices whose label starts with ``prefix`` ordered by
+        label.
+        """
+        prefix = smart_unicode(prefix).lower()
+        choices = []
+
+        for key, i in self._labels[bisect_left(self._keys, prefix):]:
+            if not key.startswith(prefix) or len(choices) == limit:
+                break
+            choices.append(self.choices[i])
+
+        return tuple(choices)
+
+
+class ChoicesCache(object):
+    """Process-wide cache of ``ChoicesIndex`` objects keyed by the
+    ``Definition`` natural key. The least recently used index is evicted
+    when the cache is full. Entries are invalidated when the corresponding
+    ``Definition`` is saved or deleted.
+    """
+    def __init__(self, maxsize=None, timeout=None):
+        self._cache = LRUCache(maxsize, timeout)
+
+    def __contains__(self, key):
+        return tuple(key) in self._cache
+
+    def __len__(self):
+        return len(self._cache)
+
+    def get(self, definition):
+        """Returns the ``ChoicesIndex`` for the definition, building it if
+        needed. ``None`` is returned if the definition does not have choices.
+        """
+        if not definition.has_choices:
+            return
+
+        index = self._cache.get(definition.natural_key())
+        if index is None:
+            index = self.refresh(definition)
+        return index
+
+    def refresh(self, definition):
+        """Rebuilds the ``ChoicesIndex`` for the definition from the data.
+        Only definitions with choices are indexed since every distinct value
+        is held in memory.
+        """
+        if not definition.has_choices:
+            return
+
+        index = ChoicesIndex(definition.values)
+
+        if self._cache.maxsize != 0:
+            self._cache.set(definition.natural_key(), index)
+        return index
+
+    def invalidate(self, key=None):
+        "Invalidates a single natural key or the whole cache."
+        if key is None:
+            self._cache.clear()
+        else:
+            self._cache.delete(tuple(key))
+
+    @property
+    def stats(self):
+        return self._cache.stats
+
+
+choices = ChoicesCache(settings.CHOICES_CACHE_SIZE,
+    settings.CHOICES_CACHE_TIMEOUT)
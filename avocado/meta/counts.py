@@ -0,0 +1,155 @@
+"""
+Caches the result counts of logic trees applied to a queryset. The key is a
+hash of a canonical representation of the compiled condition, annotations and
+the base queryset, so equivalent trees share an entry regardless of how the
+children of their logical operators are ordered.
+
+The backend is defined by the ``COUNT_CACHE_BACKEND`` setting. Counts become
+stale when the underlying data changes, so data loading routines should send
+the ``data_loaded`` signal (or call ``invalidate``) when they finish. The
+signal only reaches the process sending it, so deployments with multiple
+processes should use the ``DjangoBackend`` with a shared cache.
+"""
+import hashlib
+from django.dispatch import Signal
+from django.utils import tree
+from django.utils.encoding import smart_str
+from django.utils.importlib import import_module
+
+from avocado.conf import settings
+from avocado.utils.cache import LRUCache
+
+# sent by data loading routines after the data has changed. the sender
+# should be the model which was loaded
+data_loaded = Signal()
+
+class LocalBackend(object):
+    """Stores the counts in a process-wide least-recently-used cache. This is
+    only suitable for a single process since ``clear`` does not reach the
+    caches of other processes, which serve stale counts until they expire.
+    """
+    def __init__(self, maxsize=None, timeout=None):
+        self._cache = LRUCache(maxsize, timeout)
+
+    def get(self, key):
+        return self._cache.get(key)
+
+    def set(self, key, value):
+        self._cache.set(key, value)
+
+    def clear(self):
+        self._cache.clear()
+
+    @property
+    def stats(self):
+        return self._cache.stats
+
+
+class DjangoBackend(object):
+    """Stores the counts using Django's cache framework, so they are shared
+    across processes. Since the entries cannot be deleted as a group, the
+    keys are versioned by a generation which is incremented on ``clear``.
+    """
+    generation_key = 'avocado:counts:generation'
+
+    def __init__(self, maxsize=None, timeout=None):
+        from django.core.cache import cache
+        self._cache = cache
+        self.timeout = timeout
+
+    def _key(self, key):
+        generation = self._cache.get(self.generation_key, 0)
+        return 'avocado:counts:%s:%s' % (generation, key)
+
+    def get(self, key):
+        return self._cache.get(self._key(key))
+
+    def set(self, key, value):
+        self._cache.set(self._key(key), value, self.timeout)
+
+    def clear(self):
+        try:
+            self._cache.incr(self.generation_key)
+        except ValueError:
+            self._cache.set(self.generation_key, 1)
+
+
+def get_backend(path):
+    module, name = path.rsplit('.', 1)
+    backend = getattr(import_module(module), name)
+    return backend(settings.COUNT_CACHE_SIZE, settings.COUNT_CACHE_TIMEOUT)
+
+
+def _serialize(value):
+    "Returns a canonical string representation of a condition."
+    if isinstance(value, tree.Node):
+        # the children of AND and OR are commutative
+        children = sorted(_serialize(x) for x in value.children)
+        return '%s%s(%s)' % ('NOT ' if value.negated else '',
+            value.connector, ','.join(children))
+
+    if isinstance(value, tuple) and len(value) == 2 \
+        and isinstance(value[0], basestring):
+        return '%s=%s' % (value[0], _serialize(value[1]))
+
+    if isinstance(value, (set, frozenset)):
+        return '{%s}' % ','.join(sorted(_serialize(x) for x in value))
+
+    if hasattr(value, '__iter__'):
+        return '[%s]' % ','.join(_serialize(x) for x in value)
+
+    return repr(value)
+
+
+def _serialize_annotations(annotations):
+    return repr(sorted((name, x.__class__.__name__, x.lookup,
+        sorted(x.extra.items())) for name, x in annotations.iteritems()))
+
+
+class CountCache(object):
+    """Caches ``node.apply(queryset).count()``. Set ``COUNT_CACHE_BACKEND``
+    to ``None`` to disable the cache.
+    """
+    def __init__(self, backend=None):
+        self.backend = backend
+
+    def _key(self, node, queryset):
+        model = queryset.model._meta
+
+        raw = '|'.join(smart_str(x) for x in [
+            queryset.db,
+            '%s.%s' % (model.app_label, model.module_name),
+            queryset.query,
+            _serialize(node.condition) if node.condition else '',
+            _serialize_annotations(node.annotations or {}),
+        ])
+
+        return hashlib.sha1(raw).hexdigest()
+
+    def count(self, node, queryset):
+        if self.backend is None:
+            return node.apply(queryset).count()
+
+        key = self._key(node, queryset)
+        count = self.backend.get(key)
+
+        if count is None:
+            count = node.apply(queryset).count()
+            self.backend.set(key, count)
+        return count
+
+    def invalidate(self):
+        "Invalidates all cached counts."
+        if self.backend is not None:
+            self.backend.clear()
+
+
+if settings.COUNT_CACHE_BACKEND:
+    counts = CountCache(get_backend(settings.COUNT_CACHE_BACKEND))
+else:
+    counts = CountCache()
+
+def invalidate(sender=None, **kwargs):
+    counts.invalidate()
+
+data_loaded.connect(invalidate)
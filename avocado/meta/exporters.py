@@ -1,86 +1,803 @@
 import csv
-from django.http import HttpReponse
-from modeltree.query import ModelTreeQuerySet
+import json
+import uuid
+import zipfile
+from itertools import izip
+from cStringIO import StringIO
+from collections import OrderedDict
+from django.db import connections, transaction
+from django.db.models import Q
+from django.utils.encoding import smart_str, force_unicode
+from django.core.serializers.json import DjangoJSONEncoder
 from avocado.utils import loader
+from avocado.utils.iter import chunked
+
+# numpy and pyarrow are optional and are only required for the binary
+# columnar exporters. they are only imported when used
+numpy = loader.lazy_import('numpy')
+pyarrow = loader.lazy_import('pyarrow', 'pyarrow.parquet')
+
+# internal datatypes of fields that store integers. these are exported as
+# integers rather than floats by the columnar exporters
+INTEGER_TYPES = ('auto', 'biginteger', 'integer', 'positiveinteger',
+    'positivesmallinteger', 'smallinteger')
+
+def unique_names(names):
+    """Returns a copy of ``names`` with duplicates suffixed by a number,
+    since certain formats require unique column names.
+
+    >>> unique_names(['Name', 'Age', 'Name'])
+    ['Name', 'Age', 'Name 2']
+    """
+    seen = {}
+    unique = []
+    for name in names:
+        if name in seen:
+            seen[name] += 1
+            name = u'%s %d' % (name, seen[name])
+        else:
+            seen[name] = 1
+        unique.append(name)
+    return unique
+
+def _export_range(args):
+    """Reads and formats the rows for a single primary key range. This is
+    executed in a separate process, so everything it needs must be passed
+    in and be picklable. An upper bound of ``None`` denotes the last range.
+    """
+    exporter_class, model, query, using, concepts, lo, hi = args
+
+    # querysets cannot be pickled without being evaluated, so the query is
+    # passed in and the queryset is rebuilt
+    queryset = model._default_manager.db_manager(using).all()
+    queryset.query = query
+    queryset = queryset.filter(pk__gte=lo).order_by('pk')
+
+    if hi is not None:
+        queryset = queryset.filter(pk__lt=hi)
+
+    exporter = exporter_class(queryset, concepts)
+    plan = exporter.get_plan()
+
+    return list(exporter._format_rows(plan,
+        exporter._iter_rows(plan.fields)))
+
+
+class ChunkBuffer(object):
+    """A write-only file-like object which holds the data written to it
+    until it is drained. ``tell`` reports the total number of bytes written,
+    so writers which record offsets (e.g. Parquet, zip archives) still
+    produce valid output even though the data is drained along the way.
+    """
+    def __init__(self):
+        self._buff = StringIO()
+        self._offset = 0
+        self.closed = False
+
+    def write(self, data):
+        self._buff.write(data)
+
+    def tell(self):
+        return self._offset + self._buff.tell()
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    @property
+    def pending(self):
+        "The number of bytes written, but not yet drained."
+        return self._buff.tell()
+
+    def drain(self):
+        "Returns the pending data and resets the buffer."
+        data = self._buff.getvalue()
+        self._offset += len(data)
+        self._buff.seek(0)
+        self._buff.truncate()
+        return data
+
+
+class RowPlan(object):
+    """A compiled plan for transforming raw rows into formatted data. All the
+    concept metadata (definitions, display names, slice offsets and bound
+    formatters) is resolved once when the plan is created, so applying the
+    plan to a row is purely an in-memory operation.
+
+        ``fields`` - the model fields to be selected in the order the values
+        are expected in each row
+
+        ``header`` - the display names for each field
+    """
+    def __init__(self, concepts, preferred_formats=None):
+        self.steps = []
+        self.fields = []
+        self.header = []
+        self.definitions = []
+
+        offset = 0
+
+        for concept in concepts:
+            cdefs = list(concept.conceptdefinitions.select_related('definition'))
+
+            formatter = concept.get_formatter(preferred_formats)
+            formatter.length = len(cdefs)
+
+            keys, names, definitions = [], [], []
+
+            for cdef in cdefs:
+                definition = cdef.definition
+                keys.append(definition.field_name)
+                names.append(cdef.name or definition.name)
+                definitions.append(definition)
+
+            self.steps.append((concept, formatter, offset,
+                offset + len(cdefs), zip(keys, names, definitions)))
+
+            self.fields.extend([d.field for d in definitions])
+            self.header.extend(names)
+            self.definitions.extend(definitions)
+
+            offset += len(cdefs)
+
+    def __call__(self, row):
+        "Returns a generator of the formatted data for each concept."
+        for concept, formatter, start, end, template in self.steps:
+            values = OrderedDict()
+
+            for (key, name, definition), value in izip(template, row[start:end]):
+                values[key] = {
+                    'name': name,
+                    'value': value,
+                    'definition': definition,
+                }
+
+            yield formatter(values, concept)
+
+    def format_block(self, rows):
+        """Formats a block of rows at once using the columnar
+        ``Formatter.format_batch`` API. Returns a list of flat rows containing
+        the formatted values.
+        """
+        if not rows:
+            return []
+
+        columns = []
+
+        for concept, formatter, start, end, template in self.steps:
+            block = OrderedDict()
+
+            for i, (key, name, definition) in enumerate(template, start):
+                block[key] = {
+                    'name': name,
+                    'values': [row[i] for row in rows],
+                    'definition': definition,
+                }
+
+            # the formatter is a partial with the preferred choice bound, if
+            # one is supported by the formatter
+            out = formatter.func.format_batch(block, concept,
+                **(formatter.keywords or {}))
+
+            columns.extend([x['values'] for x in out.itervalues()])
+
+        return zip(*columns)
+
 
 class Exporter(object):
-    "The base class for all Exporters."
+    """The base class for all Exporters. Subclasses must implement ``write``
+    for the format being exported.
+
+    Like the other registries, a single instance of each exporter is
+    registered. Calling the instance with a queryset and concepts returns a
+    new exporter for that data.
+    """
+    short_name = ''
+
+    content_type = 'application/octet-stream'
+
+    file_extension = ''
 
     preferred_formats = ()
 
-    def __init__(self, queryset, concepts):
-        if not isinstance(queryset, ModelTreeQuerySet):
+    # the approximate number of bytes that are buffered before a chunk
+    # is yielded when streaming the export
+    chunk_size = 64 * 1024
+
+    # the encoding used for the output when writing the export
+    encoding = 'utf-8'
+
+    # the number of rows fetched from the database at a time. if ``None``,
+    # the whole result set is fetched by the database driver up front.
+    # otherwise a server-side cursor is used for PostgreSQL and keyset
+    # pagination on the primary key is used for all other backends
+    batch_size = None
+
+    # the number of rows formatted at a time using the formatters' columnar
+    # ``format_batch`` API when streaming the export
+    block_size = 1000
+
+    # the number of processes used to read and format the rows in parallel.
+    # the rows are split into primary key ranges of ``batch_size`` (or
+    # ``block_size``) keys which are each processed independently and the
+    # output is merged back in order. this is only supported for integer
+    # primary keys and outside of transactions
+    workers = None
+
+    # the number of primary key ranges queued per worker at a time. the
+    # formatted rows of at most this many ranges per worker are held in
+    # memory waiting to be yielded
+    ranges_per_worker = 4
+
+    def __init__(self, queryset=None, concepts=None):
+        from modeltree.query import ModelTreeQuerySet
+
+        if queryset is not None and not isinstance(queryset, ModelTreeQuerySet):
             queryset = queryset._clone(klass=ModelTreeQuerySet)
 
         self.queryset = queryset
         self.concepts = concepts
 
-    def _get_raw_query(self, concepts):
-        fields = []
+    def __call__(self, queryset, concepts):
+        return self.__class__(queryset, concepts)
+
+    def __unicode__(self):
+        return u'%s' % self.short_name
+
+    def _get_raw_query(self, fields, queryset=None):
+        """Returns a raw query selecting only the values of ``fields``, so
+        the rows are tuples in the order of the fields rather than model
+        instances.
+        """
+        if queryset is None:
+            queryset = self.queryset
+
+        return queryset.select(include_pk=False, *fields).raw()
+
+    def _server_side_iter(self, fields, batch_size):
+        """Iterates over the rows using a named (server-side) cursor which is
+        specific to PostgreSQL. Only ``batch_size`` rows are transferred to
+        the client at a time.
+        """
+        connection = connections[self.queryset.db]
+
+        # ensures the underlying connection has been opened
+        connection.cursor()
+
+        raw_query = self._get_raw_query(fields)
+
+        cursor = connection.connection.cursor(name='avocado_export_%s' %
+            uuid.uuid4().hex)
+        cursor.itersize = batch_size
+
+        try:
+            cursor.execute(raw_query.sql, raw_query.params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield row
+        finally:
+            cursor.close()
+
+    def _keyset_iter(self, fields, batch_size):
+        """Iterates over the rows in batches of ``batch_size`` root objects
+        ordered by the primary key. The primary keys of each batch are
+        fetched relative to the last primary key of the previous batch, so
+        the cost of each query stays constant unlike using ``OFFSET``. The
+        rows are then fetched for the whole batch of primary keys, since
+        concepts joined through a to-many relationship produce multiple rows
+        per root object which must not be split across batches.
+        """
+        pk = self.queryset.model._meta.pk
+
+        queryset = self.queryset.order_by(pk.name)
+        last = None
+
+        # the lookups are wrapped in ``Q`` objects, since modeltree only
+        # passes those through as is rather than resolving them
+
+        while True:
+            batch = queryset
+            if last is not None:
+                batch = batch.filter(Q(pk__gt=last))
+
+            pks = list(batch.values_list('pk', flat=True)\
+                .distinct()[:batch_size])
+
+            if not pks:
+                break
+
+            for row in self._get_raw_query(fields,
+                queryset.filter(Q(pk__in=pks))):
+                yield row
+
+            if len(pks) < batch_size:
+                break
+
+            last = pks[-1]
+
+    def _iter_rows(self, fields, batch_size=None):
+        if batch_size is None:
+            batch_size = self.batch_size
+
+        if not batch_size:
+            return iter(self._get_raw_query(fields))
+
+        if connections[self.queryset.db].vendor == 'postgresql':
+            return self._server_side_iter(fields, batch_size)
+        return self._keyset_iter(fields, batch_size)
+
+    def _format_rows(self, plan, rows):
+        "Returns a generator of flat rows of formatted values."
+        for block in chunked(rows, self.block_size):
+            for row in plan.format_block(block):
+                yield row
+
+    def _in_transaction(self):
+        "Returns true if a transaction is being managed on any connection."
+        return any(transaction.is_managed(using=alias) for alias in connections)
+
+    def _pk_ranges(self, batch_size):
+        """Returns a generator of half-open primary key ranges ``(lo, hi)``
+        which each contain ``batch_size`` primary keys of the queryset. The
+        upper bound of the last range is ``None``. The boundaries are taken
+        from the primary keys themselves, so gaps in the keys do not result
+        in empty ranges. Each boundary is fetched relative to the previous
+        one, so the cost of each query stays constant.
+        """
+        pk = self.queryset.model._meta.pk
+        queryset = self.queryset.order_by(pk.name)
+
+        pks = list(queryset.values_list('pk', flat=True)[:1])
+
+        # nothing to export
+        if not pks:
+            return
+
+        lo = pks[0]
+
+        while True:
+            # the lookup is wrapped in a ``Q`` object, since modeltree only
+            # passes those through as is rather than resolving them
+            pks = list(queryset.filter(Q(pk__gte=lo))\
+                .values_list('pk', flat=True).distinct()\
+                [batch_size:batch_size + 1])
+
+            if not pks:
+                yield lo, None
+                break
 
-        for c in concepts:
-            fields.extend([d.field for d in c.definitions.all()])
+            yield lo, pks[0]
+            lo = pks[0]
 
-        raw_query = self.queryset.select(*fields)
+    def _parallel_tasks(self, batch_size):
+        "Returns a generator of the arguments for each ``_export_range`` call."
+        queryset = self.queryset
 
-        return raw_query
+        for lo, hi in self._pk_ranges(batch_size):
+            yield (self.__class__, queryset.model, queryset.query,
+                queryset.db, self.concepts, lo, hi)
 
-    def _read_row(self, row, formatters):
-        for i, (c, f) in enumerate(formatters):
-            data, row = row[:f.length], row[f.length:]
-            values = c.get_formatter_values(data)
-            yield f(values, c)
+    def _parallel_iter(self, plan, workers, batch_size=None):
+        """Splits the queryset into primary key ranges of ``batch_size`` keys
+        and reads and formats each range in a process pool. The rows are
+        yielded in primary key order. Only ``ranges_per_worker`` ranges per
+        worker are queued at a time, so the memory used is bounded by the
+        batch size rather than the size of the export.
+        """
+        batch_size = batch_size or self.batch_size or self.block_size
 
-    def read(self, concepts=None):
+        tasks = self._parallel_tasks(batch_size)
+
+        # the worker processes must not share the parent's database
+        # connections, so they are closed prior to forking. they will be
+        # re-opened on demand, i.e. by the parent when fetching the range
+        # boundaries. this is safe since the parallel path is not used
+        # while a transaction is being managed
+        for connection in connections.all():
+            connection.close()
+
+        import multiprocessing
+        pool = multiprocessing.Pool(workers)
+
+        try:
+            # ``imap`` returns the results in the order of the tasks
+            for window in chunked(tasks, workers * self.ranges_per_worker):
+                for rows in pool.imap(_export_range, window):
+                    for row in rows:
+                        yield row
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+    def _iter_formatted(self, plan, batch_size=None, workers=None):
+        if workers is None:
+            workers = self.workers
+
+        # parallel processing relies on integer primary key ranges. it is
+        # also not used within a transaction since the connections must be
+        # closed prior to forking the workers
+        if workers > 1 and not self._in_transaction():
+            pk = self.queryset.model._meta.pk
+            if pk.get_internal_type() in ('AutoField', 'IntegerField',
+                'BigIntegerField', 'PositiveIntegerField'):
+                return self._parallel_iter(plan, workers, batch_size)
+
+        return self._format_rows(plan, self._iter_rows(plan.fields, batch_size))
+
+    def _encode(self, value):
+        return smart_str(value, encoding=self.encoding)
+
+    def get_plan(self, concepts=None):
+        "Returns a compiled ``RowPlan`` for the concepts being exported."
         concepts = concepts or self.concepts
+        return RowPlan(concepts, self.preferred_formats)
+
+    def header(self, concepts=None):
+        """Returns the header row derived from the concept metadata. This does
+        not require the data to be read, so it can be written up front.
+        """
+        return self.get_plan(concepts).header
+
+    def read(self, concepts=None, batch_size=None, plan=None):
+        """Returns a generator of row generators. If ``batch_size`` (or the
+        ``batch_size`` class attribute) is set, the rows are fetched from the
+        database in batches.
+        """
+        # compile the plan ahead of time, so no queries are performed
+        # while processing each row
+        if plan is None:
+            plan = self.get_plan(concepts)
+
+        for row in self._iter_rows(plan.fields, batch_size):
+            yield plan(row)
+
+    def rows(self, concepts=None, batch_size=None, workers=None):
+        """Returns a generator of flat, encoded rows starting with the header.
+        If ``workers`` (or the ``workers`` class attribute) is greater than
+        one, the rows are read and formatted in parallel.
+        """
+        plan = self.get_plan(concepts)
+
+        yield [self._encode(x) for x in plan.header]
+
+        for row in self._iter_formatted(plan, batch_size, workers):
+            yield [self._encode(x) for x in row]
+
+    def write(self, buff, plan, rows):
+        """Writes the export to ``buff`` given the compiled ``plan`` and the
+        formatted ``rows``. This must be a generator which yields each time
+        data has been written, so the output can be drained as it is written.
+        """
+        raise NotImplementedError
+
+    def stream(self, chunk_size=None, batch_size=None, workers=None):
+        """Returns a generator which yields encoded chunks of the export. At
+        most ``chunk_size`` bytes (plus one row or block) are held in memory
+        at any given time regardless of the number of rows being exported.
+        """
+        chunk_size = chunk_size or self.chunk_size
+
+        plan = self.get_plan()
+        rows = self._iter_formatted(plan, batch_size, workers)
+
+        buff = ChunkBuffer()
+
+        for _ in self.write(buff, plan, rows):
+            if buff.pending >= chunk_size:
+                yield buff.drain()
+
+        # flush whatever is left over
+        if buff.pending:
+            yield buff.drain()
 
-        # cache each concept formatter a head of time
-        formatters = [(x, x.get_formatter(self.preferred_formats)) \
-            for x in concepts]
+    def export(self, buff, chunk_size=None, batch_size=None, workers=None):
+        "Writes the whole export to a file-like object ``buff``."
+        for chunk in self.stream(chunk_size, batch_size, workers):
+            buff.write(chunk)
+        return buff
 
-        for row in iter(self._get_raw_query(concepts)):
-            yield self._read_row(row, formatters)
 
-    def export(self, buff):
-        headers = []
-        table_gen = self.read()
+class CSVExporter(Exporter):
+    "Exports the data as comma-separated values with a header row."
 
+    short_name = 'CSV'
+
+    content_type = 'text/csv'
+
+    file_extension = 'csv'
+
+    preferred_formats = ('csv', 'string')
+
+    def write(self, buff, plan, rows):
         csv_writer = csv.writer(buff, quoting=csv.QUOTE_MINIMAL)
 
-        for i, row_gen in enumerate(table_gen):
+        csv_writer.writerow([self._encode(x) for x in plan.header])
+        yield
+
+        for row in rows:
+            csv_writer.writerow([self._encode(x) for x in row])
+            yield
+
+
+class ColumnarExporter(Exporter):
+    """Base class for exporters which retain the native datatypes of the
+    data. Each definition corresponds to exactly one column, so the
+    formatters are expected to pass the raw values through.
+    """
+    def _check_block(self, plan, block):
+        if block and len(block[0]) != len(plan.definitions):
+            raise ValueError('%s exports require one value per definition, '
+                'but the formatters returned %d values for %d definitions' %
+                (self.short_name, len(block[0]), len(plan.definitions)))
+
+    def _coerce(self, definition, values):
+        "Coerces a column of values to the native type of the definition."
+        datatype = definition.datatype
+
+        if datatype == 'number':
+            if definition._get_internal_type() in INTEGER_TYPES:
+                return values
+            return [None if x is None else float(x) for x in values]
+
+        # certain backends represent booleans as integers
+        if datatype == 'boolean':
+            return [None if x is None else bool(x) for x in values]
+
+        return values
+
+    def blocks(self, plan, rows):
+        "Returns a generator of coerced columns for each block of rows."
+        for block in chunked(rows, self.block_size):
+            self._check_block(plan, block)
+            yield [self._coerce(d, list(c)) for d, c in
+                izip(plan.definitions, izip(*block))]
+
+
+class NDJSONExporter(ColumnarExporter):
+    """Exports the data as newline-delimited JSON, one object per row keyed
+    by the column names. Numbers and booleans retain their types, while dates
+    and times are represented as ISO 8601 strings.
+    """
+    short_name = 'NDJSON'
+
+    content_type = 'application/x-ndjson'
+
+    file_extension = 'ndjson'
+
+    preferred_formats = ('json', 'raw')
+
+    def write(self, buff, plan, rows):
+        names = unique_names(plan.header)
+        encoder = DjangoJSONEncoder()
+
+        for columns in self.blocks(plan, rows):
+            for row in izip(*columns):
+                buff.write(encoder.encode(OrderedDict(izip(names, row))))
+                buff.write('\n')
+            yield
+
 
-            row = []
-            for data in row_gen:
-                values = data.values()
-                if i == 0:
-                    headers.extend([x['name'] for x in values])
+class ArrowExporter(ColumnarExporter):
+    """Exports the data as an Arrow IPC stream. Each block of rows is written
+    as a separate record batch. Requires pyarrow.
+    """
+    short_name = 'Arrow'
 
-                for value in values:
-                    row.append(value)
+    content_type = 'application/vnd.apache.arrow.stream'
 
-            csv_writer.writerow(row, )
-            # closing of this row..
-            # write header if first row
-            # write data
+    file_extension = 'arrow'
 
-        # closing out file...
+    preferred_formats = ('arrow', 'raw')
 
+    def _arrow_type(self, definition):
+        datatype = definition.datatype
 
-def export(request):
-    # get exporter given requst
+        if datatype == 'number':
+            if definition._get_internal_type() in INTEGER_TYPES:
+                return pyarrow.int64()
+            return pyarrow.float64()
 
-    exporter = Exporter()
-    resp = HttpReponse()
+        if datatype == 'boolean':
+            return pyarrow.bool_()
+        if datatype == 'date':
+            return pyarrow.date32()
+        if datatype == 'datetime':
+            return pyarrow.timestamp('us')
+        if datatype == 'time':
+            return pyarrow.time64('us')
+        return pyarrow.string()
 
-    gen = exporter.export(resp)
+    def _coerce(self, definition, values):
+        values = super(ArrowExporter, self)._coerce(definition, values)
+
+        if definition.datatype not in ('number', 'boolean', 'date',
+            'datetime', 'time'):
+            return [None if x is None else force_unicode(x) for x in values]
+        return values
+
+    def schema(self, plan):
+        "Returns the Arrow schema derived from the definitions' datatypes."
+        names = unique_names(plan.header)
+        return pyarrow.schema([pyarrow.field(n, self._arrow_type(d))
+            for n, d in izip(names, plan.definitions)])
+
+    def batches(self, plan, rows, schema):
+        "Returns a generator of record batches for each block of rows."
+        for columns in self.blocks(plan, rows):
+            arrays = [pyarrow.array(c, type=f.type) for c, f in
+                izip(columns, schema)]
+            yield pyarrow.RecordBatch.from_arrays(arrays, schema.names)
+
+    def write(self, buff, plan, rows):
+        schema = self.schema(plan)
+        writer = pyarrow.RecordBatchStreamWriter(buff, schema)
+
+        for batch in self.batches(plan, rows, schema):
+            writer.write_batch(batch)
+            yield
+
+        writer.close()
+
+
+class ParquetExporter(ArrowExporter):
+    """Exports the data as a Parquet file. Each block of rows is written as a
+    separate row group. Requires pyarrow.
+    """
+    short_name = 'Parquet'
+
+    content_type = 'application/octet-stream'
+
+    file_extension = 'parquet'
+
+    # row groups should be reasonably large for Parquet to be efficient
+    block_size = 64 * 1024
+
+    def write(self, buff, plan, rows):
+        schema = self.schema(plan)
+        writer = pyarrow.parquet.ParquetWriter(buff, schema)
+
+        for batch in self.batches(plan, rows, schema):
+            writer.write_table(pyarrow.Table.from_batches([batch]))
+            yield
+
+        writer.close()
+
+
+class NumPyExporter(ColumnarExporter):
+    """Exports the data as a NumPy ``.npz`` archive. This is a fallback for
+    when pyarrow is not installed. Each block of rows is stored as a separate
+    array per column named ``<block>/<column>``, since the archive is
+    streamed. Use ``load`` to read back one array per column. Integer and
+    boolean columns containing NULL values are stored as floats with NaN and
+    NULL dates are stored as NaT.
+    """
+    short_name = 'NumPy'
+
+    content_type = 'application/octet-stream'
+
+    file_extension = 'npz'
+
+    preferred_formats = ('numpy', 'raw')
+
+    def _array(self, definition, values):
+        datatype = definition.datatype
+
+        if datatype in ('number', 'boolean'):
+            if None not in values:
+                if datatype == 'boolean':
+                    return numpy.array(values, dtype='bool')
+                if definition._get_internal_type() in INTEGER_TYPES:
+                    return numpy.array(values, dtype='int64')
+            return numpy.array([numpy.nan if x is None else x for x in values],
+                dtype='float64')
+
+        if datatype == 'date':
+            return numpy.array(values, dtype='datetime64[D]')
+        if datatype == 'datetime':
+            return numpy.array(values, dtype='datetime64[us]')
+
+        return numpy.array([u'' if x is None else force_unicode(x)
+            for x in values], dtype=unicode)
+
+    def _name(self, name):
+        "Returns a column name which is safe to use in an archive path."
+        return smart_str(name).replace('/', '_').replace('\\', '_')
+
+    @classmethod
+    def load(cls, f):
+        """Loads an archive written by this exporter and returns an ordered
+        dict of column names and their arrays with the blocks concatenated.
+        """
+        archive = numpy.load(f)
+        blocks = {}
+
+        for key in archive.files:
+            block, name = key.split('/', 1)
+            blocks.setdefault(int(block), []).append((name, archive[key]))
+
+        columns = OrderedDict()
+        for block in sorted(blocks):
+            for name, array in blocks[block]:
+                columns.setdefault(name, []).append(array)
+
+        return OrderedDict((name, numpy.concatenate(arrays))
+            for name, arrays in columns.iteritems())
+
+    def write(self, buff, plan, rows):
+        names = [self._name(x) for x in unique_names(plan.header)]
+        archive = zipfile.ZipFile(buff, 'w', zipfile.ZIP_STORED, True)
+
+        for i, columns in enumerate(self.blocks(plan, rows)):
+            for name, definition, values in izip(names, plan.definitions,
+                columns):
+                npy = StringIO()
+                numpy.save(npy, self._array(definition, values))
+                archive.writestr('%d/%s.npy' % (i, name), npy.getvalue())
+            yield
+
+        archive.close()
+
+
+def export(request, queryset, concepts, name=None, filename=None, **kwargs):
+    """Returns a response which streams the export of ``queryset`` to the
+    client rather than building the whole file in memory. ``name`` is the
+    name of the registered exporter to use, CSV is used by default. An
+    unknown name or a format whose dependencies are not installed raises
+    ``NotRegistered`` rather than falling back to CSV. Additional keyword
+    arguments are passed to ``Exporter.stream``.
+    """
+    from django.http import HttpResponse
+
+    # ``StreamingHttpResponse`` is only available in newer versions of Django.
+    # older versions will consume an iterator passed in as the content lazily
+    # as long as no middleware accesses ``response.content``
+    try:
+        from django.http import StreamingHttpResponse
+    except ImportError:
+        StreamingHttpResponse = HttpResponse
+
+    if name is not None and name not in registry:
+        raise loader.NotRegistered('No exporter is registered with the '
+            'name "%s"' % name)
+
+    exporter = registry[name](queryset, concepts)
+
+    if filename is None:
+        filename = 'export.%s' % exporter.file_extension
+
+    resp = StreamingHttpResponse(exporter.stream(**kwargs),
+        content_type=exporter.content_type)
+    resp['Content-Disposition'] = 'attachment; filename="%s"' % filename
 
     return resp
 
 
 # initialize the registry that will contain all classes for this type of
-# registry
-registry = loader.Registry()
+# registry. the exporters modules of the installed apps are discovered on the
+# first lookup
+registry = loader.Registry(default=CSVExporter, module_name='exporters')
+
+registry.register(CSVExporter, 'csv')
+registry.register(NDJSONExporter, 'ndjson')
+
+# the binary columnar formats depend on optional libraries
+if pyarrow is not None:
+    registry.register(ArrowExporter, 'arrow')
+    registry.register(ParquetExporter, 'parquet')
 
-# this will be invoked when it is imported by models.py to use the
-# registry choices
-loader.autodiscover('exporters')
+if numpy is not None:
+    registry.register(NumPyExporter, 'npz')
@@ -2,6 +2,10 @@ from collections import OrderedDict
 from django.utils.encoding import force_unicode
 from avocado.utils import loader
 
+# numpy is optional, but enables vectorized batch implementations for
+# certain formats. it is only imported when used
+numpy = loader.lazy_import('numpy')
+
 def noop(k, v, d, c, **x): return v
 
 class Formatter(object):
@@ -77,12 +81,122 @@ class Formatter(object):
 
         return out
 
+    def _format_rows(self, method, columns, concept, **context):
+        # methods that process multiple values at once have no columnar
+        # equivalent, so each row is reconstructed and processed
+        # independently. the output is then transposed back into columns
+        keys = columns.keys()
+        nrows = len(columns[keys[0]]['values'])
+
+        out = OrderedDict()
+
+        for i in xrange(nrows):
+            values = OrderedDict()
+            for key in keys:
+                column = columns[key]
+                values[key] = {
+                    'name': column['name'],
+                    'value': column['values'][i],
+                    'definition': column['definition'],
+                }
+
+            data = method(values, concept, **context)
+
+            # mimic the merging of the output in ``__call__``
+            if not isinstance(data, OrderedDict):
+                values.update(data)
+                data = values
+
+            for key, fdata in data.iteritems():
+                if key not in out:
+                    out[key] = {
+                        'name': fdata['name'],
+                        'definition': fdata['definition'],
+                        'values': [],
+                    }
+                out[key]['values'].append(fdata['value'])
+
+        return out
+
+    def format_batch(self, columns, concept, choice=None, **context):
+        """Columnar equivalent of calling the formatter once per row. This
+        avoids the per-row method lookups and copying of the values.
+
+            ``columns`` - an OrderedDict containing the block of values for
+            each definition along with the definition itself.
+
+            ::
+
+                columns = OrderedDict({
+                    'first_name': {
+                        'name': 'First Name',
+                        'values': ['Bob', 'Joe', ...],
+                        'definition': <Definition "First Name">),
+                    },
+                    ...
+                })
+
+        An OrderedDict of the same structure is returned containing the
+        formatted values. A ``to_*`` method may declare a ``batch`` function
+        which takes the whole list of values for a definition at once,
+        otherwise the method is called for each value. If the method returns
+        a dict, only the ``value`` is used.
+        """
+        if len(columns) == 0:
+            raise ValueError, 'no values supplied'
+
+        if choice and choice not in self:
+            raise AttributeError, 'the "%s" formatter is not supported' % choice
+
+        method = getattr(self, 'to_%s' % choice, noop)
+
+        if getattr(method, 'process_multiple', False):
+            return self._format_rows(method, columns, concept, **context)
+
+        batch = getattr(method, 'batch', None)
+
+        out = OrderedDict()
+
+        for key, column in columns.iteritems():
+            name = column['name']
+            values = column['values']
+            definition = column['definition']
+
+            if batch is not None:
+                fvalues = batch(self, name, values, definition, concept,
+                    **context)
+            else:
+                fvalues = []
+                for value in values:
+                    fdata = method(name, value, definition, concept, **context)
+                    if type(fdata) is dict:
+                        fdata = fdata['value']
+                    fvalues.append(fdata)
+
+            fcolumn = column.copy()
+            fcolumn['values'] = fvalues
+            out[key] = fcolumn
+
+        return out
+
     def __contains__(self, choice):
         return hasattr(self, 'to_%s' % choice)
 
     def __unicode__(self):
         return u'%s' % self.name
 
+    def _to_string_batch(self, name, values, definition, concept, **context):
+        # integer columns can be converted in a single pass by numpy. floats
+        # are not handled here since numpy's string representation differs
+        # from python's
+        if numpy is not None and definition.datatype == 'number':
+            array = numpy.asarray(values)
+            if array.dtype.kind in 'iu':
+                return array.astype(unicode).tolist()
+
+        return [u'' if value is None else force_unicode(value,
+            strings_only=False) for value in values]
+
     def to_string(self, name, value, definition, concept, **context):
         # attempt to coerce non-strings to strings. depending on the data
         # types that are being passed into this, this may not be good
@@ -92,6 +206,7 @@ class Formatter(object):
         return force_unicode(value, strings_only=False)
 
     to_string.none = u''
+    to_string.batch = _to_string_batch
 
     def to_html(self, values, concept, **context):
         new_values = []
@@ -104,7 +219,7 @@ class Formatter(object):
             # representing None is HTML needs to be distinct, so we include a
             # special style for it
             if value is None:
-                tok = self.none
+                tok = self.to_html.none
 
             # convert bools to their yes/no equivalents 
             elif type(value) is bool:
@@ -128,9 +243,6 @@ class Formatter(object):
 
 
 # initialize the registry that will contain all classes for this type of
-# registry
-registry = loader.Registry(default=Formatter)
-
-# this will be invoked when it is imported by models.py to use the
-# registry choices
-loader.autodiscover('formatters')
+# registry. the formatters modules of the installed apps are discovered on the
+# first lookup
+registry = loader.Registry(default=Formatter, module_name='formatters')
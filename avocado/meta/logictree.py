@@ -38,8 +38,17 @@ Two examples as follows:
         }]
     }
 """
+import json
+import copy
+import hashlib
+from django.db.models.signals import post_save, post_delete
 from modeltree import MODELTREE_DEFAULT_ALIAS
-from avocado.models import Field, Criterion, CriterionField
+
+from avocado.conf import settings
+from avocado.meta import translators
+from avocado.meta.counts import counts
+from avocado.meta.models import Definition, Concept, ConceptDefintion
+from avocado.utils.cache import LRUCache
 
 AND = 'AND'
 OR = 'OR'
@@ -48,9 +57,15 @@ class Node(object):
     condition = None
     annotations = None
 
+    # the node as it was parsed, if this node is the result of ``optimize``
+    raw_node = None
+
     def get_field_ids(self):
         return []
 
+    def get_conditions(self):
+        return []
+
     def apply(self, queryset, *args, **kwargs):
         if self.annotations:
             queryset = queryset.values('pk').annotate(**self.annotations)
@@ -58,6 +73,12 @@ class Node(object):
             queryset = queryset.filter(self.condition)
         return queryset
 
+    def count(self, queryset):
+        """Returns the count of ``apply(queryset)``. Counts are cached by
+        ``avocado.meta.counts``.
+        """
+        return counts.count(self, queryset)
+
     @property
     def text(self, *args, **kwargs):
         pass
@@ -75,29 +96,33 @@ class Condition(Node):
 
     @property
     def _meta(self):
-        if not hasattr(self, '__meta'):
-            self.__meta = self.field.translate(self.operator, self.value,
-                using=self.using, **self.context)
-        return self.__meta
+        if not hasattr(self, '_translated'):
+            self._translated = self.definition.translate(self.operator,
+                self.value, using=self.using, **self.context)
+        return self._translated
+
+    # the below objects are typically resolved in bulk for the whole tree
+    # by ``resolve`` and set directly on the node. they are otherwise
+    # fetched on demand
 
     @property
-    def criterion(self):
-        if not hasattr(self, '_criterion'):
-            self._criterion = Criterion.objects.get(id=self.concept_id)
-        return self._criterion
+    def concept(self):
+        if not hasattr(self, '_concept'):
+            self._concept = Concept.objects.get(id=self.concept_id)
+        return self._concept
 
     @property
-    def criterionfield(self):
-        if not hasattr(self, '_criterionfield'):
-            self._criterionfield = CriterionField.objects.get(concept__id=self.concept_id,
-                field__id=self.id)
-        return self._criterionfield
+    def conceptdefinition(self):
+        if not hasattr(self, '_conceptdefinition'):
+            self._conceptdefinition = ConceptDefintion.objects.get(
+                concept__id=self.concept_id, definition__id=self.id)
+        return self._conceptdefinition
 
     @property
-    def field(self):
-        if not hasattr(self, '_field'):
-            self._field = Field.objects.get(id=self.id)
-        return self._field
+    def definition(self):
+        if not hasattr(self, '_definition'):
+            self._definition = Definition.objects.get(id=self.id)
+        return self._definition
 
     @property
     def condition(self):
@@ -109,20 +134,26 @@ class Condition(Node):
 
     @property
     def text(self, flatten=True):
+        if self.raw_node is not None:
+            return self.raw_node.text
+
         operator = self._meta['cleaned_data']['operator']
         # the original value is used here to prevent representing a different
         # value from what the client had submitted. this text has no impact
         # on the stored 'cleaned' data structure
         value = self._meta['raw_data']['value']
-        return {'conditions': [self.criterionfield.text(operator, value)]}
+        return {'conditions': [self.conceptdefinition.text(operator, value)]}
 
     def get_field_ids(self):
         return [self.id]
 
+    def get_conditions(self):
+        return [self]
+
 
 class LogicalOperator(Node):
     "Provides a logical relationship between it's children."
-    def __init__(self, type, using=DEFAULT_MODELTREE_ALIAS):
+    def __init__(self, type, using=MODELTREE_DEFAULT_ALIAS):
         self.using = using
         self.type = (type.upper() == AND) and AND or OR
         self.children = []
@@ -141,6 +172,8 @@ class LogicalOperator(Node):
                     condition = self._combine(node.condition, condition)
                 else:
                     condition = node.condition
+            if condition and settings.OPTIMIZE_QUERY_TREES:
+                condition = dedupe_condition(condition)
             self._condition = condition
         return self._condition
 
@@ -154,6 +187,9 @@ class LogicalOperator(Node):
 
     @property
     def text(self, flatten=True):
+        if self.raw_node is not None:
+            return self.raw_node.text
+
         if not hasattr(self, '_text'):
             text = {'type': self.type.lower(), 'conditions': []}
             for node in self.children:
@@ -172,9 +208,282 @@ class LogicalOperator(Node):
             ids.extend(node.get_field_ids())
         return ids
 
+    def get_conditions(self):
+        conditions = []
+        for node in self.children:
+            conditions.extend(node.get_conditions())
+        return conditions
+
+
+def resolve(node):
+    """Fetches the definitions, concepts and concept definitions for all
+    conditions in the tree in bulk and sets them on the condition nodes. The
+    number of queries is constant regardless of the size of the tree.
+    """
+    conditions = node.get_conditions()
+
+    if not conditions:
+        return node
+
+    definition_ids = set(node.get_field_ids())
+    concept_ids = set([c.concept_id for c in conditions])
+    concept_ids.discard(None)
+
+    definitions, concepts, cdefs = {}, {}, {}
+
+    # the concept definitions contain the definitions, so only those not
+    # referenced by a concept definition are fetched separately. the concepts
+    # are not selected along with them, since ``select_related`` tests the
+    # truth of each related object which calls ``Concept.__len__`` and
+    # results in a query per row
+    if concept_ids:
+        queryset = ConceptDefintion.objects.select_related('definition')\
+            .filter(concept__id__in=concept_ids,
+            definition__id__in=definition_ids)
+
+        for cdef in queryset:
+            cdefs[(cdef.concept_id, cdef.definition_id)] = cdef
+            definitions[cdef.definition_id] = cdef.definition
+
+        concepts = Concept.objects.in_bulk(list(concept_ids))
+
+    missing = definition_ids.difference(definitions)
+    if missing:
+        definitions.update(Definition.objects.in_bulk(list(missing)))
+
+    # objects which do not exist are not set, so the error is raised when
+    # the node attempts to access it
+    for condition in conditions:
+        if condition.id in definitions:
+            condition._definition = definitions[condition.id]
+        if condition.concept_id in concepts:
+            condition._concept = concepts[condition.concept_id]
+        if (condition.concept_id, condition.id) in cdefs:
+            cdef = cdefs[(condition.concept_id, condition.id)]
+            # avoids a query when the concept definition's concept is accessed
+            if condition.concept_id in concepts:
+                cdef.concept = concepts[condition.concept_id]
+            condition._conceptdefinition = cdef
+
+    return node
+
+
+def _value_key(value):
+    """Returns a hashable key for comparing lookup values. Sequences are
+    compared by their contents and the type is included since equal values
+    of different types, e.g. ``1`` and ``True``, may not be equivalent
+    lookups.
+    """
+    if isinstance(value, (list, tuple, translators.LargeInList)):
+        return (value.__class__, tuple([_value_key(x) for x in value]))
+    if isinstance(value, (set, frozenset)):
+        return (value.__class__, frozenset([_value_key(x) for x in value]))
+
+    try:
+        hash(value)
+    except TypeError:
+        # cannot be compared, so it is only equal to itself
+        return (value.__class__, id(value))
+    return (value.__class__, value)
+
+def dedupe_condition(condition):
+    """Removes duplicate lookups from the top-level of a combined ``Q``
+    object. Since ``x AND x`` and ``x OR x`` are both equivalent to ``x``,
+    this is always safe. This primarily removes the repeated NOT NULL
+    primary key conditions added by the translators.
+    """
+    seen = set()
+    children = []
+
+    for child in condition.children:
+        if isinstance(child, tuple):
+            key = (child[0], _value_key(child[1]))
+            if key in seen:
+                continue
+            seen.add(key)
+        children.append(child)
+
+    condition.children = children
+    return condition
+
+
+def _is_number(value):
+    return isinstance(value, (int, long, float)) and not isinstance(value, bool)
+
+def _copy_condition(condition, operator, value):
+    "Returns a new condition for the same definition and concept."
+    new = Condition(condition.context, using=condition.using, id=condition.id,
+        operator=operator, value=value, concept_id=condition.concept_id)
+
+    # carry over any resolved objects
+    for attr in ('_definition', '_concept', '_conceptdefinition'):
+        if hasattr(condition, attr):
+            setattr(new, attr, getattr(condition, attr))
+    return new
+
+def _allows(condition, operator):
+    "Checks if the operator is permitted for the condition's definition."
+    definition = condition.definition
+    translator = translators.registry[definition.translator]
+    return operator in (translator.operators or definition.operators or ())
+
+def _dedupe(children):
+    "Removes identical conditions."
+    seen = set()
+    unique = []
+    for child in children:
+        if isinstance(child, Condition):
+            key = (child.id, child.concept_id, child.operator,
+                _value_key(child.value))
+            if key in seen:
+                continue
+            seen.add(key)
+        unique.append(child)
+    return unique
+
+def _group(children, test):
+    """Groups the conditions passing ``test`` by their definition and concept.
+    Returns the children with only the first condition of each group along
+    with the groups keyed by the first condition.
+    """
+    keys = {}
+    groups = {}
+    heads = []
+
+    for child in children:
+        if isinstance(child, Condition) and test(child):
+            key = (child.id, child.concept_id)
+            if key in keys:
+                groups[keys[key]].append(child)
+                continue
+            keys[key] = child
+            groups[child] = [child]
+        heads.append(child)
+
+    return heads, groups
+
+def _is_exact(condition):
+    if condition.operator == 'exact':
+        return condition.value is not None and not isinstance(condition.value,
+            (list, tuple, dict))
+    if condition.operator == 'in':
+        return isinstance(condition.value, list) and None not in condition.value
+    return False
+
+def _merge_exact(children):
+    """Merges ``exact`` and ``in`` conditions for the same definition into a
+    single ``in`` condition. This is only applicable to OR nodes.
+    """
+    heads, groups = _group(children, _is_exact)
+    merged = []
+
+    for child in heads:
+        group = groups.get(child)
+
+        if not group or len(group) < 2:
+            merged.append(child)
+        # the conditions cannot be merged if ``in`` is not permitted
+        elif not _allows(child, 'in'):
+            merged.extend(group)
+        else:
+            values = []
+            for x in group:
+                for value in (x.value if x.operator == 'in' else [x.value]):
+                    if value not in values:
+                        values.append(value)
+            merged.append(_copy_condition(child, 'in', values))
+
+    return merged
+
+def _is_numeric_range(condition):
+    value = condition.value
+    return (condition.operator == 'range' and isinstance(value, (list, tuple))
+        and len(value) == 2 and _is_number(value[0]) and _is_number(value[1]))
+
+def _fold_ranges(children, type):
+    """Folds numeric ``range`` conditions for the same definition. For AND
+    nodes the ranges are intersected and for OR nodes overlapping ranges are
+    combined.
+    """
+    heads, groups = _group(children, _is_numeric_range)
+    folded = []
+
+    for child in heads:
+        group = groups.get(child)
+
+        if not group or len(group) < 2:
+            folded.append(child)
+            continue
+
+        ranges = sorted([list(x.value) for x in group])
+
+        if type == AND:
+            lo = max([x[0] for x in ranges])
+            hi = min([x[1] for x in ranges])
+            # an empty intersection is left as is
+            if lo > hi:
+                folded.extend(group)
+                continue
+            ranges = [[lo, hi]]
+        else:
+            combined = [ranges[0]]
+            for lo, hi in ranges[1:]:
+                if lo <= combined[-1][1]:
+                    combined[-1][1] = max(hi, combined[-1][1])
+                else:
+                    combined.append([lo, hi])
+            ranges = combined
+
+        folded.extend([_copy_condition(child, 'range', x) for x in ranges])
+
+    return folded
+
+def optimize(node):
+    """Simplifies the node tree prior to building the condition. The
+    following rewrites are performed:
+
+        - nested logical operators of the same type are flattened
+        - duplicate conditions are removed
+        - ``exact`` conditions for the same definition in an OR are merged
+        into a single ``in`` condition
+        - numeric ``range`` conditions for the same definition are
+        intersected (AND) or combined if they overlap (OR)
+
+    The node returned may be a different instance, ``node`` itself is not
+    modified.
+    """
+    if not isinstance(node, LogicalOperator):
+        return node
 
-def transform(rnode, pnode=None, using=DEFAULT_MODELTREE_ALIAS, **context):
-    "Takes the raw data structure and converts it into the node tree."
+    children = []
+    for child in node.children:
+        child = optimize(child)
+        if isinstance(child, LogicalOperator) and child.type == node.type:
+            children.extend(child.children)
+        else:
+            children.append(child)
+
+    children = _dedupe(children)
+
+    if node.type == OR:
+        children = _merge_exact(children)
+
+    children = _fold_ranges(children, node.type)
+
+    # a single remaining child no longer needs the logical operator
+    if len(children) == 1:
+        return children[0]
+
+    optimized = LogicalOperator(node.type, using=node.using)
+    optimized.children = children
+    return optimized
+
+
+def transform(rnode, pnode=None, using=MODELTREE_DEFAULT_ALIAS, **context):
+    """Takes the raw data structure and converts it into the node tree. The
+    objects referenced by the conditions are resolved in bulk for the whole
+    tree and the tree is optimized if ``OPTIMIZE_QUERY_TREES`` is enabled.
+    """
     if not rnode:
         return Node()
 
@@ -190,6 +499,102 @@ def transform(rnode, pnode=None, using=DEFAULT_MODELTREE_ALIAS, **context):
         node = Condition(context, using=using, **rnode)
     # top level node returns, i.e. no parent node
     if pnode is None:
+        node = resolve(node)
+        if settings.OPTIMIZE_QUERY_TREES:
+            optimized = optimize(node)
+            # the text reflects the conditions the client had submitted
+            # rather than the rewritten ones
+            if optimized is not node:
+                optimized.raw_node = node
+            node = optimized
         return node
     pnode.children.append(node)
 
+
+class CompiledNode(Node):
+    """A node containing only the compiled condition and annotations of a
+    tree. This is what is stored in the ``QueryCache``.
+    """
+    def __init__(self, condition, annotations, field_ids):
+        self.condition = condition
+        self.annotations = annotations
+        self.field_ids = field_ids
+
+    def get_field_ids(self):
+        return list(self.field_ids)
+
+
+class QueryCache(object):
+    """Caches the compiled condition and annotations of raw query trees. The
+    key is a hash of the canonical JSON representation of the tree along with
+    the modeltree alias and context. Entries referencing a ``Definition`` are
+    invalidated when it is saved or deleted.
+    """
+    def __init__(self, maxsize=None, timeout=None):
+        self._cache = LRUCache(maxsize, timeout)
+
+    def _key(self, rnode, using, context):
+        # trees which cannot be represented as JSON cannot be cached
+        try:
+            raw = json.dumps([rnode, using, context], sort_keys=True,
+                separators=(',', ':'))
+        except (TypeError, ValueError):
+            return
+        return hashlib.sha1(raw).hexdigest()
+
+    def _compile(self, rnode, using, context):
+        node = transform(rnode, using=using, **context)
+        return CompiledNode(node.condition, node.annotations or {},
+            frozenset(node.get_field_ids()))
+
+    def transform(self, rnode, using=MODELTREE_DEFAULT_ALIAS, **context):
+        """Returns a ``CompiledNode`` for the raw tree. The tree is transformed
+        and compiled only if it is not already cached.
+        """
+        key = self._key(rnode, using, context)
+
+        if key is not None:
+            node = self._cache.get(key)
+            if node is not None:
+                # the Q objects are copied to prevent the cached ones from
+                # being modified downstream
+                return copy.deepcopy(node)
+
+        node = self._compile(rnode, using, context)
+
+        if key is not None:
+            self._cache.set(key, copy.deepcopy(node))
+        return node
+
+    def invalidate(self, definition_id=None):
+        "Invalidates all trees referencing the definition or the whole cache."
+        if definition_id is None:
+            self._cache.clear()
+            return
+
+        for key, node in self._cache.items():
+            if definition_id in node.field_ids:
+                self._cache.delete(key)
+
+    @property
+    def stats(self):
+        return self._cache.stats
+
+
+cache = QueryCache(settings.QUERY_CACHE_SIZE, settings.QUERY_CACHE_TIMEOUT)
+
+def cached_transform(rnode, using=MODELTREE_DEFAULT_ALIAS, **context):
+    """Equivalent to ``transform``, but returns a ``CompiledNode`` which is
+    cached. The cache is bypassed if ``QUERY_CACHE_SIZE`` is zero.
+    """
+    if not settings.QUERY_CACHE_SIZE:
+        return cache._compile(rnode, using, context)
+    return cache.transform(rnode, using=using, **context)
+
+
+# compiled trees must be invalidated any time a definition changes
+def invalidate_query_cache(sender, instance, **kwargs):
+    cache.invalidate(instance.pk)
+
+post_save.connect(invalidate_query_cache, sender=Definition)
+post_delete.connect(invalidate_query_cache, sender=Definition)
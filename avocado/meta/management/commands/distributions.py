@@ -0,0 +1,70 @@
+from optparse import make_option
+from django.core.management.base import BaseCommand
+
+from avocado.meta.models import Definition
+
+class Command(BaseCommand):
+    """
+    SYNOPSIS::
+
+        python manage.py avocado distributions [options...] [labels...]
+
+    DESCRIPTION:
+
+        Stores the value distribution for each ``Definition`` referenced by
+        the app, model or field ``labels``. If no labels are given, all
+        definitions are refreshed. Subsequent refreshes are incremental for
+        models with a modified timestamp field.
+
+    OPTIONS:
+
+        ``--full`` - recompute the whole distribution rather than only the
+        values of rows modified since the last refresh
+
+        ``--modified-field`` - the name of the modified timestamp field
+        used for incremental refreshes, default is ``modified``
+
+    """
+
+    help = "Stores the value distributions for the listed Definitions."
+
+    args = '<app app.model app.model.field ...>'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--full', action='store_true',
+            dest='full', default=False,
+            help='Recompute the whole distribution'),
+
+        make_option('--modified-field', action='store',
+            dest='modified_field', default='modified',
+            help='The timestamp field used for incremental refreshes'),
+    )
+
+    def handle(self, *labels, **options):
+        full = options.get('full')
+        modified_field = options.get('modified_field')
+        verbosity = int(options.get('verbosity', 1))
+
+        definitions = Definition.objects.all()
+
+        if labels:
+            keys = ('app_name', 'model_name', 'field_name')
+            pks = set()
+
+            for label in labels:
+                filters = dict(zip(keys, label.split('.')))
+                pks.update(definitions.filter(**filters)\
+                    .values_list('pk', flat=True))
+
+            definitions = definitions.filter(pk__in=pks)
+
+        for definition in definitions:
+            # orphaned definitions are skipped
+            if definition.field is None:
+                continue
+
+            count = definition.refresh_distribution(full=full,
+                modified_field=modified_field)
+
+            if verbosity:
+                print '%s: %d values refreshed' % (definition, count)
@@ -0,0 +1,70 @@
+from optparse import make_option
+from django.db import transaction
+from django.core.management.base import NoArgsCommand
+
+from avocado.meta import models as meta_models, logictree
+from avocado.meta.models import Definition
+
+class Command(NoArgsCommand):
+    """
+    SYNOPSIS::
+
+        python manage.py avocado fingerprints [options...]
+
+    DESCRIPTION:
+
+        Recomputes the fingerprint of the field underlying each
+        ``Definition`` and reports the definitions whose field has changed,
+        e.g. its type, nullability, max length or choices, since the
+        fingerprint was recorded by ``sync``.
+
+    OPTIONS:
+
+        ``--update`` - stores the new fingerprints and invalidates the
+        cached metadata, choices and query trees of the changed definitions
+
+    """
+
+    help = "Reports Definitions whose underlying field has changed."
+
+    option_list = NoArgsCommand.option_list + (
+        make_option('--update', action='store_true',
+            dest='update', default=False,
+            help='Store the new fingerprints of changed Definitions'),
+    )
+
+    @transaction.commit_on_success
+    def handle_noargs(self, **options):
+        update = options.get('update')
+        verbosity = options.get('verbosity')
+
+        changed = []
+        for definition in Definition.objects.all():
+            fingerprint = definition.metadata.fingerprint
+            if fingerprint != definition.fingerprint:
+                changed.append((definition, fingerprint))
+
+        if update:
+            # a single update per distinct fingerprint
+            groups = {}
+            for definition, fingerprint in changed:
+                groups.setdefault(fingerprint, []).append(definition.pk)
+
+            for fingerprint, pks in groups.iteritems():
+                Definition.objects.filter(pk__in=pks)\
+                    .update(fingerprint=fingerprint)
+
+            # ``update`` does not send the save signals
+            for definition, fingerprint in changed:
+                meta_models.invalidate_metadata(Definition, definition)
+                logictree.invalidate_query_cache(Definition, definition)
+
+        if verbosity:
+            print '%d definitions changed' % len(changed)
+            for definition, fingerprint in changed:
+                if fingerprint is None:
+                    print '\t%s (field removed)' % definition
+                elif definition.fingerprint is None:
+                    print '\t%s (not recorded)' % definition
+                else:
+                    print '\t%s' % definition
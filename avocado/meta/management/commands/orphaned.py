@@ -1,7 +1,10 @@
+import hashlib
+from datetime import datetime
 from optparse import make_option
+from django.db import models, transaction
 from django.core.management.base import NoArgsCommand
 
-from avocado.meta.models import Definition
+from avocado.meta.models import Definition, ModelFingerprint
 
 class Command(NoArgsCommand):
     """
@@ -21,6 +24,9 @@ class Command(NoArgsCommand):
         ``--unpublish`` - unpublishes orphaned ``Definition`` if currently
         published
 
+        ``--since`` - only checks the definitions of models whose fields have
+        changed since the last run
+
     """
 
     help = "Determines outdated or orphaned Definitions."
@@ -29,42 +35,95 @@ class Command(NoArgsCommand):
         make_option('--unpublish', action='store_true',
             dest='unpublish', default=False,
             help='Unpublishes orphaned Definitions'),
+
+        make_option('--since', action='store_true',
+            dest='since', default=False,
+            help='Only check models changed since the last run'),
     )
 
-    def _print(self, objs, msg, unpublish=False):
+    def _print(self, objs, msg):
         print
-        print '%s:\n', msg
+        print '%s:' % msg
         for o in objs:
             print '\t',
             if o.published:
-                if unpublish:
-                    o.published = False
-                    o.save()
                 print '[P]',
             else:
                 print '   ',
             print o
 
+    def _get_index(self):
+        "Returns a dict of the field names per (app_name, model_name)."
+        index = {}
+        for model in models.get_models():
+            key = (model._meta.app_label, model._meta.object_name.lower())
+            # includes related objects, since these are resolvable by
+            # ``Definition.field`` as well
+            index[key] = frozenset(model._meta.get_all_field_names())
+        return index
+
+    def _get_fingerprints(self, index):
+        return dict((key, hashlib.sha1(','.join(sorted(names))).hexdigest())
+            for key, names in index.iteritems())
+
+    def _get_changed(self, fingerprints):
+        "Returns the set of model keys changed since the last run."
+        recorded = {}
+        for app_name, model_name, fingerprint in ModelFingerprint.objects\
+            .values_list('app_name', 'model_name', 'fingerprint'):
+            recorded[(app_name, model_name)] = fingerprint
+
+        changed = set(key for key, fingerprint in fingerprints.iteritems()
+            if recorded.get(key) != fingerprint)
+
+        # removed models
+        return changed.union(set(recorded).difference(fingerprints))
+
+    def _record(self, fingerprints):
+        now = datetime.now()
+        ModelFingerprint.objects.all().delete()
+        ModelFingerprint.objects.bulk_create([ModelFingerprint(app_name=k[0],
+            model_name=k[1], fingerprint=v, modified=now)
+            for k, v in fingerprints.iteritems()])
+
+    @transaction.commit_on_success
     def handle_noargs(self, **options):
         unpublish = options.get('unpublish')
         verbosity = options.get('verbosity')
+        since = options.get('since')
+
+        index = self._get_index()
+        fingerprints = self._get_fingerprints(index)
 
         definitions = Definition.objects.all()
 
+        if since:
+            changed = self._get_changed(fingerprints)
+            definitions = [d for d in definitions
+                if (d.app_name, d.model_name.lower()) in changed]
+
         unknown_models = []
         unknown_fields = []
 
         for d in definitions:
-            if d.model is None:
+            key = (d.app_name, d.model_name.lower())
+            if key not in index:
                 unknown_models.append(d)
-            elif d.field is None:
+            elif d.field_name not in index[key]:
                 unknown_fields.append(d)
 
+        if unpublish:
+            pks = [d.pk for d in unknown_models + unknown_fields if d.published]
+            if pks:
+                Definition.objects.filter(pk__in=pks).update(published=False)
+
+        self._record(fingerprints)
+
         if verbosity:
             if not unknown_models and not unknown_fields:
                 print '0 definitions orphaned'
             else:
                 if unknown_models:
-                    self._print(unknown_models, 'The following Definitions have an unknown model', unpublish)
+                    self._print(unknown_models, 'The following Definitions have an unknown model')
                 if unknown_fields:
-                    self._print(unknown_fields, 'The following Definitions have an unknown field', unpublish)
+                    self._print(unknown_fields, 'The following Definitions have an unknown field')
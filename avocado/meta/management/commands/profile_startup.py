@@ -0,0 +1,57 @@
+import os
+import sys
+import json
+import subprocess
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+class Command(BaseCommand):
+    """
+    SYNOPSIS::
+
+        python manage.py avocado profile-startup [modules...]
+
+    DESCRIPTION:
+
+        Reports the time taken to import each of the listed ``modules`` and
+        the number of modules loaded as a side effect, followed by the time
+        taken to discover the translators, formatters and exporters of the
+        installed apps. The imports are measured in a fresh interpreter
+        since the modules are already loaded in this one. If no modules are
+        given, Django, ModelTree and the core Avocado modules are profiled.
+
+    """
+
+    help = "Reports the import and registry discovery cost of Avocado."
+
+    args = '<module module ...>'
+
+    def handle(self, *modules, **options):
+        code = 'from avocado.utils import profiling; profiling.main(%r)' % \
+            (list(modules) or None)
+
+        env = os.environ.copy()
+        env['PYTHONPATH'] = os.pathsep.join(sys.path)
+        env['DJANGO_SETTINGS_MODULE'] = settings.SETTINGS_MODULE
+
+        process = subprocess.Popen([sys.executable, '-c', code], env=env,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        stdout, stderr = process.communicate()
+
+        if process.returncode:
+            raise CommandError('Profiling failed:\n%s' % stderr)
+
+        results = json.loads(stdout)
+
+        print '%-40s %10s %8s' % ('module', 'ms', 'loaded')
+        for name, elapsed, loaded in results['imports']:
+            print '%-40s %10.1f %8d' % (name, elapsed * 1000, loaded)
+
+        print
+        print '%-40s %10s %8s' % ('registry', 'ms', 'apps')
+        for name, elapsed, count in results['registries']:
+            print '%-40s %10.1f %8d' % (name, elapsed * 1000, count)
+
+        print
+        print 'total: %.1f ms, %d modules loaded' % (results['total'] * 1000,
+            results['modules'])
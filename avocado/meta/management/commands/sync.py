@@ -1,9 +1,11 @@
+from datetime import datetime
 from optparse import make_option
 
-from django.db import models
-from django.core.management.base import LabelCommand
+from django.db import models, transaction
+from django.core.management.base import LabelCommand, CommandError
 
 from avocado.meta.models import Definition, Domain
+from avocado.meta.cache import get_fingerprint
 
 class Command(LabelCommand):
     """
@@ -16,6 +18,8 @@ class Command(LabelCommand):
         Finds all models referenced by the app or model ``labels`` and
         attempts to create a ``Definition`` instance per model field.
         Any ``Definition`` already loaded will not be altered in any way.
+        The new definitions (and domains) are created in bulk within a
+        single transaction.
 
     OPTIONS:
 
@@ -25,6 +29,9 @@ class Command(LabelCommand):
         ``--include-non-editable`` - create ``Definition`` for fields that are
         not editable in the admin
 
+        ``--dry-run`` - report the number of definitions which would be added
+        per model without saving anything
+
     """
 
     help = """Finds all models in the listed app(s) and attempts to create a
@@ -41,7 +48,11 @@ class Command(LabelCommand):
 
         make_option('--include-non-editable', action='store_true',
             dest='include_non_editable', default=False,
-            help='Create definitions for non-editable fields')
+            help='Create definitions for non-editable fields'),
+
+        make_option('--dry-run', action='store_true',
+            dest='dry_run', default=False,
+            help='Report the definitions which would be added'),
     )
 
     # these are ignored since these join fields will be determined at runtime
@@ -54,24 +65,9 @@ class Command(LabelCommand):
         models.ManyToManyField,
     )
 
-    def __init__(self, *args, **kwargs):
-        super(Command, self).__init__(*args, **kwargs)
-        self._domains = {}
-
-    def _get_domain(self, model):
-        if self._domains.has_key(model):
-            domain = self._domains[model]
-        else:
-            domain, is_new = Domain.objects.get_or_create(name=model._meta.verbose_name)
-            self._domains[model] = domain
-        return domain
-
-    def handle_label(self, label, **options):
+    def _get_models(self, label):
         "Handles app_label or app_label.model_label formats."
         labels = label.split('.')
-        mods = None
-        create_domains = options.get('create_domains')
-        include_non_editable = options.get('include_non_editable')
 
         # a specific model is defined
         if len(labels) == 2:
@@ -80,28 +76,78 @@ class Command(LabelCommand):
 
             if model is None:
                 print 'Cannot find model "%s", skipping...' % label
-                return
+                return []
 
-            mods = [model]
+            return [model]
 
         # get all models for the app
-        else:
-            app = models.get_app(*labels)
-            mods = models.get_models(app)
+        app = models.get_app(*labels)
+        mods = models.get_models(app)
+
+        if mods is None:
+            print 'Cannot find app "%s", skipping...' % label
+            return []
+
+        return mods
+
+    def _create_domains(self, mods, dry_run=False):
+        "Creates the missing domains for the models in bulk."
+        names = set(m._meta.verbose_name for m in mods)
+        missing = names.difference(Domain.objects.filter(name__in=names)\
+            .values_list('name', flat=True))
 
-            if mods is None:
-                print 'Cannot find app "%s", skipping...' % label
-                return
+        if missing and not dry_run:
+            now = datetime.now()
 
-        app_name = labels[0]
+            # ``bulk_create`` bypasses ``save`` which sets the order of the
+            # domain relative to its parent, so the order is set here. the
+            # new domains are appended to the top-level domains
+            order = Domain.objects.filter(parent__isnull=True).count()
 
-        for model in mods:
+            Domain.objects.bulk_create([Domain(name=name, created=now,
+                modified=now, _order=order + i) for i, name in
+                enumerate(sorted(missing))])
+
+        return len(missing)
+
+    @transaction.commit_on_success
+    def handle(self, *labels, **options):
+        if not labels:
+            raise CommandError('Enter at least one %s.' % self.args)
+
+        create_domains = options.get('create_domains')
+        include_non_editable = options.get('include_non_editable')
+        dry_run = options.get('dry_run')
+        verbosity = int(options.get('verbosity', 1))
+
+        app_models = []
+        for label in labels:
+            app_name = label.split('.')[0].lower()
+            for model in self._get_models(label):
+                if (app_name, model) not in app_models:
+                    app_models.append((app_name, model))
+
+        if not app_models:
+            return
+
+        # all existing natural keys are loaded up front rather than checking
+        # each field separately
+        app_names = set(app_name for app_name, model in app_models)
+        existing = set(Definition.objects.filter(app_name__in=app_names)\
+            .values_list('app_name', 'model_name', 'field_name'))
+
+        if create_domains:
+            cnt = self._create_domains([m for a, m in app_models], dry_run)
+            if verbosity and dry_run:
+                print '%d domains would be added' % cnt
+
+        now = datetime.now()
+        definitions = []
+
+        for app_name, model in app_models:
             cnt = 0
             model_name = model._meta.object_name.lower()
 
-            if create_domains:
-                domain = self._get_domain(model)
-
             for field in model._meta.fields:
                 # in most cases the primary key fields and non-editable will not
                 # be necessary. editable usually include timestamps and such
@@ -113,33 +159,31 @@ class Command(LabelCommand):
                 if not field.editable and not include_non_editable:
                     continue
 
-                kwargs = {
-                    'app_name': app_name.lower(),
-                    'model_name': model_name,
-                    'field_name': field.name,
-                }
+                key = (app_name, model_name, field.name)
 
-                # do initial lookup to see if it already exists, skip if it does
-                if Definition.objects.filter(**kwargs).exists():
-                    print '%s.%s already exists. Skipping...' % (model_name, field.name)
+                # skip if it already exists
+                if key in existing:
+                    if verbosity:
+                        print '%s.%s already exists. Skipping...' % (model_name, field.name)
                     continue
 
-                # add verbose name
-                kwargs['name'] = field.verbose_name.title()
-
-                definition = Definition(**kwargs)
+                existing.add(key)
 
-                if create_domains:
-                    definition.domain = domain
-
-                definition.published = False
-                definition.save()
+                definitions.append(Definition(app_name=app_name,
+                    model_name=model_name, field_name=field.name,
+                    name=field.verbose_name.title(), published=False,
+                    fingerprint=get_fingerprint(field), created=now,
+                    modified=now))
 
                 cnt += 1
 
-            if cnt == 1:
-                print '1 definition added for %s' % model_name
-            else:
-                print '%d definitions added for %s' % (cnt, model_name)
-
+            if verbosity:
+                if dry_run:
+                    print '%d definitions would be added for %s' % (cnt, model_name)
+                elif cnt == 1:
+                    print '1 definition added for %s' % model_name
+                else:
+                    print '%d definitions added for %s' % (cnt, model_name)
 
+        if definitions and not dry_run:
+            Definition.objects.bulk_create(definitions)
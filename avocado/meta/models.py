@@ -3,36 +3,22 @@ from collections import OrderedDict
 from datetime import datetime
 from django import forms
 from django.db import models, transaction
+from django.db.models.signals import post_save, post_delete
+from django.core.signals import request_started
 from django.contrib.sites.models import Site
-from django.utils.encoding import smart_unicode
-from django.db.models.fields import FieldDoesNotExist
-from django.utils.importlib import import_module
-from modeltree.tree import trees
 
 from avocado.conf import settings
-from avocado.meta import managers, translators, formatters
+from avocado.meta import managers, translators, formatters, utils
+from avocado.meta.cache import metadata, query_strings, get_form_class, \
+    choices as choices_cache
 
 __all__ = ('Domain', 'Concept', 'Definition')
 
-DATA_CHOICES_MAP = settings.DATA_CHOICES_MAP
-INTERNAL_DATATYPE_MAP = settings.INTERNAL_DATATYPE_MAP
-DATATYPE_OPERATOR_MAP = settings.DATATYPE_OPERATOR_MAP
-INTERNAL_DATATYPE_FORMFIELDS = settings.INTERNAL_DATATYPE_FORMFIELDS
-
-TRANSLATOR_CHOICES = translators.registry.choices
-FORMATTER_CHOICES = formatters.registry.choices
-
-def get_form_class(name):
-    # infers this is a path
-    if '.' in name:
-        path = name.split('.')[:-1]
-        mod = import_module(path)
-    # use the django forms module
-    else:
-        if not name.endswith('Field'):
-            name = name + 'Field'
-        mod = forms
-    return getattr(mod, name)
+
+# the registries are discovered when the choices are first used, rather than
+# when this module is imported
+TRANSLATOR_CHOICES = translators.registry.lazy_choices
+FORMATTER_CHOICES = formatters.registry.lazy_choices
 
 class Base(models.Model):
     """Base abstract class containing general metadata.
@@ -107,6 +93,11 @@ class Definition(Base):
     # is false, it is globally not accessible.
     published = models.BooleanField(default=False)
 
+    # a hash of the properties of the underlying field as of the last sync.
+    # this is used to determine which definitions are affected by changes
+    # to the data model
+    fingerprint = models.CharField(max_length=40, null=True, editable=False)
+
     objects = managers.DefinitionManager()
 
     class Meta(object):
@@ -147,29 +138,25 @@ class Definition(Base):
 
         return concept
 
+    @property
+    def metadata(self):
+        """Returns the resolved model metadata for this definition. This is
+        shared across all instances with the same natural key.
+        """
+        return metadata.get(self.natural_key())
+
     @property
     def model(self):
         "Returns the model class this definition is associated with."
-        if not hasattr(self, '_model'):
-            self._model = models.get_model(self.app_name, self.model_name)
-        return self._model
+        return self.metadata.model
 
     @property
     def field(self):
         "Returns the field object this definition represents."
-        if not hasattr(self, '_field'):
-            try:
-                self._field = self.model._meta.get_field_by_name(self.field_name)[0]
-            except FieldDoesNotExist:
-                self._field = None
-        return self._field
+        return self.metadata.field
 
     def _get_internal_type(self):
-        datatype = self.field.get_internal_type().lower()
-        # trim 'field' off the end
-        if datatype.endswith('field'):
-            datatype = datatype[:-5]
-        return datatype
+        return self.metadata.internal_type
 
     @property
     def datatype(self):
@@ -178,29 +165,31 @@ class Definition(Base):
         By default, it will use the field's internal type, but can be overridden
         by the ``INTERNAL_DATATYPE_MAP`` setting.
         """
-        if not hasattr(self, '_datatype'):
-            datatype = self._get_internal_type()
-            # if a mapping exists, replace the datatype
-            if INTERNAL_DATATYPE_MAP.has_key(datatype):
-                datatype = INTERNAL_DATATYPE_MAP[datatype]
-
-            self._datatype = datatype
-        return self._datatype
+        return self.metadata.datatype
 
     @property
     def operators(self):
-        operators = DATATYPE_OPERATOR_MAP[self.datatype]
-        # the ``isnull`` operator is a special case since all datatypes can
-        # be nullable. this merely checks to see if the field allows null
-        # values.
-        if self.field.null:
-            operators = operators + ('isnull', '-isnull')
-        return operators
+        """Returns the operators allowed for this definition's datatype. The
+        ``isnull`` operators are included if the field is nullable.
+        """
+        return self.metadata.operators
 
     @property
     def has_choices(self):
         return self.enable_choices or self.datatype == 'boolean'
 
+    @property
+    def choices_index(self):
+        """Returns the cached ``ChoicesIndex`` of the distinct values and
+        their labels. This supports pagination and prefix searches. Only
+        definitions with choices are indexed, otherwise ``None`` is returned.
+        """
+        return choices_cache.get(self)
+
+    def refresh_choices(self):
+        "Rebuilds the cached distinct values and choices from the data."
+        return choices_cache.refresh(self)
+
     @property
     def values(self):
         "Introspects the data and returns a distinct list of the values."
@@ -211,23 +200,55 @@ class Definition(Base):
     def choices(self):
         "Returns a distinct set of choices for this field."
         if self.has_choices:
-            values = self.values
-            # iterate over each value and attempt to get the mapped choice
-            # other fallback to the value itself
-            svalues = (smart_unicode(DATA_CHOICES_MAP.get(v, v)) for v in values)
-            return zip(values, svalues)
+            return self.choices_index.choices
 
     def translate(self, operator=None, value=None, using=None, **context):
         trans = translators.registry[self.translator]
         return trans(self, operator, value, using, **context)
 
+    def translate_many(self, conditions, using=None, **context):
+        """Translates a list of (operator, value) pairs for this definition.
+        See ``Translator.translate_many``.
+        """
+        trans = translators.registry[self.translator]
+        return trans.translate_many([(self, operator, value) for operator,
+            value in conditions], using, **context)
+
     def query_string(self, operator=None, using=None):
-        tree = trees[using]
-        return tree.query_string_for_field(self.field, operator=operator)
+        return query_strings.get(self.app_name, self.model_name,
+            self.field_name, operator=operator, using=using)
 
     def distribution(self, exclude=[], min_count=None, max_points=20,
-        order_by='field', smooth=0.01, annotate_by='id', **filters):
-        pass
+        order_by='field', smooth=0.01, annotate_by='id', bins=None,
+        stored=True, **filters):
+        """Returns the value distribution of this definition. If ``stored``
+        and the distribution has been stored, it is used in place of querying
+        the source table. Filtered or custom annotated distributions always
+        query the source table.
+        """
+        if stored and not filters and annotate_by == 'id':
+            dist = utils.stored_distribution(self, exclude=exclude,
+                min_count=min_count, max_points=max_points, order_by=order_by,
+                smooth=smooth, bins=bins)
+            if dist is not None:
+                return dist
+
+        # fixed width bins are computed by the database where possible
+        if bins == 'fixed' and max_points and min_count is None \
+            and annotate_by == 'id':
+            dist = utils.binned_distribution(self, exclude=exclude,
+                max_points=max_points, **filters)
+            if dist is not None:
+                return dist
+
+        return utils.distribution(self, exclude=exclude, min_count=min_count,
+            max_points=max_points, order_by=order_by, smooth=smooth,
+            annotate_by=annotate_by, bins=bins, **filters)
+
+    def refresh_distribution(self, full=False, modified_field='modified'):
+        "Stores the value distribution of this definition."
+        return utils.refresh_distribution(self, full=full,
+            modified_field=modified_field)
 
     def formfield(self, **kwargs):
         """Returns the default formfield class for the represented field
@@ -236,11 +257,10 @@ class Definition(Base):
         # if a form class is not specified, check to see if there is a custom
         # form_class specified for this datatype
         if not kwargs.get('form_class', None):
-            datatype = self._get_internal_type()
+            form_class = self.metadata.form_class
 
-            if datatype in INTERNAL_DATATYPE_FORMFIELDS:
-                name = INTERNAL_DATATYPE_FORMFIELDS[datatype]
-                kwargs['form_class'] = get_form_class(name)
+            if form_class is not None:
+                kwargs['form_class'] = form_class
 
         # define default arguments for the formfield class constructor
         kwargs.setdefault('label', self.name.title())
@@ -344,11 +364,12 @@ class Concept(Base):
         """
         formatter = formatters.registry[self.formatter]
 
-        if preferred_formats:
-            for x in preferred_formats:
-                if x in formatter:
-                    formatter = partial(formatter, choice=x)
-                    break
+        # fallback to the default behavior if none of the preferred formats
+        # are supported
+        for x in preferred_formats or ():
+            if x in formatter:
+                formatter = partial(formatter, choice=x)
+                break
         else:
             formatter = partial(formatter)
 
@@ -358,7 +379,7 @@ class Concept(Base):
     def _get_formatter_value(self, cdefinition, value, name=None):
         definition = cdefinition.definition
 
-        key = '{}' % definition.field_name
+        key = definition.field_name
 
         if name is None:
             name = cdefinition.name or definition.name
@@ -395,7 +416,7 @@ class ConceptDefintion(models.Model):
     order = models.FloatField(null=True)
 
     definition = models.ForeignKey(Definition)
-    concept = models.ForeignKey(Concept)
+    concept = models.ForeignKey(Concept, related_name='conceptdefinitions')
 
     created = models.DateTimeField(editable=False)
     modified = models.DateTimeField(editable=False)
@@ -410,3 +431,70 @@ class ConceptDefintion(models.Model):
         self.modified = now
         super(ConceptDefintion, self).save()
 
+    def text(self, operator, value):
+        """Returns a human-readable representation of a condition on this
+        definition in the context of the concept, e.g. ``First Name is equal
+        to Robert``.
+        """
+        name = self.name or self.definition.name
+        return u'%s %s' % (name, operator.text(value))
+
+
+class Distribution(models.Model):
+    """A stored value distribution of a ``Definition``. ``refreshed`` is the
+    time of the last refresh and is used for incremental refreshes.
+    """
+    definition = models.OneToOneField(Definition,
+        related_name='stored_distribution')
+    refreshed = models.DateTimeField(null=True)
+
+    class Meta(object):
+        app_label = 'avocado'
+
+    def __unicode__(self):
+        return u'%s distribution' % self.definition
+
+
+class DistributionValue(models.Model):
+    "A single value and its count. Values are stored as text."
+    distribution = models.ForeignKey(Distribution, related_name='values')
+    value = models.TextField(null=True)
+    count = models.IntegerField()
+
+    class Meta(object):
+        app_label = 'avocado'
+
+
+class ModelFingerprint(models.Model):
+    """The fingerprint of the field names of a model as of the last run of
+    the ``orphaned`` command. This is used to only check the definitions of
+    models that have changed since.
+    """
+    app_name = models.CharField(max_length=50)
+    model_name = models.CharField(max_length=50)
+    fingerprint = models.CharField(max_length=40)
+    modified = models.DateTimeField()
+
+    class Meta(object):
+        app_label = 'avocado'
+        unique_together = ('app_name', 'model_name')
+
+
+# the cached metadata and choices are invalidated any time a definition
+# changes
+def invalidate_metadata(sender, instance, **kwargs):
+    metadata.invalidate(instance.natural_key())
+    choices_cache.invalidate(instance.natural_key())
+
+post_save.connect(invalidate_metadata, sender=Definition)
+post_delete.connect(invalidate_metadata, sender=Definition)
+
+
+# the metadata for all definitions is resolved in a single pass when the
+# first request is handled. this cannot be done when the app is loaded since
+# the database may not be available yet, e.g. prior to running syncdb
+def warm_metadata(sender, **kwargs):
+    request_started.disconnect(warm_metadata)
+    metadata.warm()
+
+request_started.connect(warm_metadata)
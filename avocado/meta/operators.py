@@ -9,6 +9,7 @@ the right length and in some cases, type.
 from avocado.utils.iter import ins
 
 class Operator(object):
+    __slots__ = ()
     operator = ''
     short_name = ''
     verbose_name = ''
@@ -51,6 +52,7 @@ class Operator(object):
 
 
 class PrimitiveOperator(Operator):
+    __slots__ = ()
     def check(self, value):
         if ins(value):
             return False
@@ -61,6 +63,7 @@ class PrimitiveOperator(Operator):
         return '%s %s' % (self.verbose_name, value)
 
 class Exact(PrimitiveOperator):
+    __slots__ = ()
     operator = 'exact'
     short_name = '='
     verbose_name = 'is equal to'
@@ -69,6 +72,7 @@ exact = Exact()
 
 
 class iExact(PrimitiveOperator):
+    __slots__ = ()
     operator = 'iexact'
     short_name = '='
     verbose_name = 'is equal to'
@@ -77,6 +81,7 @@ iexact = iExact()
 
 
 class Contains(PrimitiveOperator):
+    __slots__ = ()
     operator = 'contains'
     short_name = 'contains'
     verbose_name = 'contains the text'
@@ -85,6 +90,7 @@ contains = Contains()
 
 
 class iContains(PrimitiveOperator):
+    __slots__ = ()
     operator = 'icontains'
     short_name = 'contains'
     verbose_name = 'contains the text'
@@ -93,6 +99,7 @@ icontains = iContains()
 
 
 class LessThan(PrimitiveOperator):
+    __slots__ = ()
     operator = 'lt'
     short_name = '<'
     verbose_name = 'is less than'
@@ -101,6 +108,7 @@ lt = LessThan()
 
 
 class GreaterThan(PrimitiveOperator):
+    __slots__ = ()
     operator = 'gt'
     short_name = '>'
     verbose_name = 'is greater than'
@@ -109,6 +117,7 @@ gt = GreaterThan()
 
 
 class LessThanOrEqual(PrimitiveOperator):
+    __slots__ = ()
     operator = 'lte'
     short_name = '<='
     verbose_name = 'is less than or equal to'
@@ -117,6 +126,7 @@ lte = LessThanOrEqual()
 
 
 class GreaterThanOrEqual(PrimitiveOperator):
+    __slots__ = ()
     operator = 'gte'
     short_name = '>='
     verbose_name = 'is greater than or equal to'
@@ -125,6 +135,7 @@ gte = GreaterThanOrEqual()
 
 
 class Null(PrimitiveOperator):
+    __slots__ = ()
     operator = 'isnull'
     short_name = 'is null'
     verbose_name = 'is null'
@@ -136,6 +147,7 @@ class Null(PrimitiveOperator):
 null = Null()
 
 class NotExact(Exact):
+    __slots__ = ()
     short_name = '!='
     verbose_name = 'is not equal to'
     negated = True
@@ -144,6 +156,7 @@ notexact = NotExact()
 
 
 class NotiExact(iExact):
+    __slots__ = ()
     short_name = '!='
     verbose_name = 'is not equal to'
     negated = True
@@ -152,6 +165,7 @@ notiexact = NotiExact()
 
 
 class DoesNotContain(Contains):
+    __slots__ = ()
     short_name = 'does not contain'
     verbose_name = 'does not contain'
     negated = True
@@ -160,6 +174,7 @@ doesnotcontain = DoesNotContain()
 
 
 class DoesNotiContain(iContains):
+    __slots__ = ()
     short_name = 'does not contain'
     verbose_name = 'does not contain'
     negated = True
@@ -168,6 +183,7 @@ doesnoticontain = DoesNotiContain()
 
 
 class NotNull(Null):
+    __slots__ = ()
     short_name = 'not null'
     verbose_name = 'is not null'
     negated = True
@@ -177,6 +193,7 @@ notnull = NotNull()
 # operators that support or require a sequence of values
 
 class SequenceOperator(Operator):
+    __slots__ = ()
     def check(self, value):
         if ins(value):
             return True
@@ -190,6 +207,7 @@ class SequenceOperator(Operator):
 
 
 class InList(SequenceOperator):
+    __slots__ = ()
     operator = 'in'
     short_name = 'in list'
     verbose_name = 'is either'
@@ -205,6 +223,7 @@ inlist = InList()
 
 
 class Between(SequenceOperator):
+    __slots__ = ()
     operator = 'range'
     short_name = 'between'
     verbose_name = 'is between'
@@ -223,6 +242,7 @@ between = Between()
 
 
 class NotBetween(Between):
+    __slots__ = ()
     short_name = 'not between'
     verbose_name = 'is not between'
     negated = True
@@ -231,6 +251,7 @@ notbetween = NotBetween()
 
 
 class NotInList(InList):
+    __slots__ = ()
     short_name = 'not in list'
     verbose_name = 'is not'
     negated = True
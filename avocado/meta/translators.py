@@ -1,17 +1,198 @@
+import time
+import json
+import datetime
+from functools import partial
+from django import forms
 from django.db.models import Q
 from django.core.exceptions import ValidationError
+from django.core.validators import EMPTY_VALUES
+from django.utils import formats
+from django.utils.encoding import smart_unicode
 
 from avocado.conf import settings
 from avocado.meta import operators
+from avocado.meta.cache import query_strings
 from avocado.utils import loader
 
 DEFAULT_OPERATOR = 'exact'
 DATATYPE_OPERATOR_MAP = settings.DATATYPE_OPERATOR_MAP
+LARGE_IN_LIST_THRESHOLD = settings.LARGE_IN_LIST_THRESHOLD
+
+# the first operator listed for each datatype is used when one is not
+# supplied
+DATATYPE_DEFAULT_OPERATORS = dict((k, v[0]) for k, v in
+    DATATYPE_OPERATOR_MAP.iteritems() if v)
+
+# the internal types whose formfield cleaning is performed directly rather
+# than building the formfield. the values are the default formfield classes
+# of the model fields
+COERCED_FORM_CLASSES = {
+    'biginteger': forms.IntegerField,
+    'integer': forms.IntegerField,
+    'positiveinteger': forms.IntegerField,
+    'positivesmallinteger': forms.IntegerField,
+    'smallinteger': forms.IntegerField,
+    'float': forms.FloatField,
+    'char': forms.CharField,
+    'text': forms.CharField,
+    'boolean': forms.BooleanField,
+    'nullboolean': forms.NullBooleanField,
+    'date': forms.DateField,
+}
+
+def _to_date(value):
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    for format in formats.get_format('DATE_INPUT_FORMATS'):
+        try:
+            return datetime.date(*time.strptime(value, format)[:3])
+        except ValueError:
+            continue
+    raise ValueError
+
+def _to_boolean(value):
+    if isinstance(value, basestring) and value.lower() in ('false', '0'):
+        return False
+    return bool(value)
+
+def _to_null_boolean(value):
+    if value in (True, 'True', '1'):
+        return True
+    if value in (False, 'False', '0'):
+        return False
+
+# the conversion and error message for the values of each formfield class.
+# the conversion raises ``ValueError`` or ``TypeError`` for invalid values
+COERCIONS = {
+    forms.IntegerField: (lambda x: int(str(x)), u'Enter a whole number.'),
+    forms.FloatField: (float, u'Enter a number.'),
+    forms.CharField: (smart_unicode, None),
+    forms.BooleanField: (_to_boolean, None),
+    forms.NullBooleanField: (_to_null_boolean, None),
+    forms.DateField: (_to_date, u'Enter a valid date.'),
+}
+
+def get_coercion(definition):
+    """Returns a function which cleans a single value for the definition the
+    same way its formfield does, without building the formfield. ``None`` is
+    returned for fields with choices, custom formfield classes and any other
+    datatypes.
+    """
+    field = definition.field
+
+    if field.choices:
+        return
+
+    form_class = definition.metadata.form_class or \
+        COERCED_FORM_CLASSES.get(definition.metadata.internal_type)
+
+    if form_class not in COERCIONS:
+        return
+
+    convert, message = COERCIONS[form_class]
+
+    required = not (field.blank or field.null)
+
+    # the formfields of the positive integer fields set a minimum value
+    if definition.metadata.internal_type.startswith('positive'):
+        min_value = 0
+    else:
+        min_value = None
+
+    if form_class is forms.CharField:
+        max_length = field.max_length
+    else:
+        max_length = None
+
+    def clean(value):
+        if value in EMPTY_VALUES:
+            if required:
+                raise ValidationError(u'This field is required.')
+            # the char fields represent empty values as empty strings
+            if form_class is forms.CharField:
+                return u''
+            if form_class is forms.BooleanField:
+                return False
+            return
+
+        try:
+            value = convert(value)
+        except (TypeError, ValueError):
+            raise ValidationError(message)
+
+        if min_value is not None and value < min_value:
+            raise ValidationError(u'Ensure this value is greater than or '
+                'equal to %s.' % min_value)
+
+        if max_length is not None and len(value) > max_length:
+            raise ValidationError(u'Ensure this value has at most %d '
+                'characters (it has %d).' % (max_length, len(value)))
+
+        return value
+
+    return clean
+
 
 class OperatorNotPermitted(Exception):
     pass
 
 
+class LargeInList(object):
+    """Wraps a large list of values used with the ``in`` lookup, e.g.
+    ``Q(id__in=LargeInList(values))``. The lookup is compiled into a subquery
+    which expands a single parameter containing all the values. On PostgreSQL
+    the parameter is an array expanded using ``unnest``, which the planner
+    can hash rather than comparing each row against every value. Note,
+    psycopg2 interpolates the array into the query text, so the query itself
+    is not smaller. On SQLite the parameter is a JSON array expanded using
+    ``json_each``, which avoids the limit on the number of parameters. Other
+    databases use a parameter per value as usual.
+    """
+    def __init__(self, values):
+        self.values = list(values)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __iter__(self):
+        return iter(self.values)
+
+    def __repr__(self):
+        return '<LargeInList: %d values>' % len(self.values)
+
+    # the values are never modified, so copies of the condition, e.g. by the
+    # query cache, share the instance
+    def __deepcopy__(self, memo):
+        return self
+
+    # django prepares the lookup value by calling ``prepare`` if defined,
+    # rather than coercing each value in the list
+    def prepare(self):
+        return self
+
+    # compiled as ``IN (<sql>)``. no statements are executed, so this is safe
+    # to call when the query is merely converted to a string
+    def _as_sql(self, connection):
+        if connection.vendor == 'postgresql':
+            return 'SELECT unnest(%s)', [self.values]
+
+        if connection.vendor == 'sqlite' and _has_json_each():
+            # dates and times are represented as strings by the sqlite
+            # backend, which is the same as their unicode representation
+            return 'SELECT value FROM json_each(%s)', \
+                [json.dumps(self.values, default=smart_unicode)]
+
+        return ', '.join(['%s'] * len(self.values)), self.values
+
+
+def _has_json_each():
+    "Returns true if the JSON functions are built into SQLite by default."
+    from django.db.backends.sqlite3.base import Database
+    return Database.sqlite_version_info >= (3, 38, 0)
+
+
 class Translator(object):
     "The base translator class that all translators must subclass."
 
@@ -24,30 +205,34 @@ class Translator(object):
     # used for validation. this is usually never necessary to override
     form_class = None
 
+    def __init__(self):
+        # the translator's operator override as a set for validation
+        self.allowed_operators = None
+        if self.operators:
+            self.allowed_operators = frozenset(self.operators)
+
     def __call__(self, *args, **kwargs):
         return self.translate(*args, **kwargs)
 
-    def _validate_operator(self, definition, operator, **kwargs):
+    def _validate_operator(self, definition, uid, **kwargs):
 
-        if not operator:
+        if not uid:
             # get the first operator in the list
-            try:
-                operator = DATATYPE_OPERATOR_MAP[definition.datatype][0]
-            except (KeyError, IndexError):
-                operator = DEFAULT_OPERATOR
+            uid = DATATYPE_DEFAULT_OPERATORS.get(definition.datatype,
+                DEFAULT_OPERATOR)
 
         # attempt to retrieve the operator. no exception handling for
         # this step exists since this should never fail
-        operator = operators.get(operator)
+        operator = operators.get(uid)
 
         if operator is None:
-            raise ValueError, '"%s" is not a valid operator' % operator
+            raise ValueError, '"%s" is not a valid operator' % uid
 
-        # determine list of allowed operators
-        if self.operators:
-            allowed_operators = self.operators
+        # determine set of allowed operators
+        if self.allowed_operators:
+            allowed_operators = self.allowed_operators
         else:
-            allowed_operators = definition.operators
+            allowed_operators = definition.metadata.allowed_operators
 
         if operator.operator not in allowed_operators:
             raise OperatorNotPermitted('operator "%s" cannot be used for '
@@ -55,20 +240,7 @@ class Translator(object):
 
         return operator
 
-    def _validate_value(self, definition, value, **kwargs):
-        if self.form_class:
-            kwargs.setdefault('form_class', self.form_class)
-
-        # TODO since None is considered an empty value by the django validators
-        # ``required`` has to be set to False to not raise a ValidationError
-        # saying the field is required. There may be a need to more explicitly
-        # check to see if the value be passed is only None and not any of the
-        # other empty values in ``django.core.validators.EMPTY_VALUES``
-        if definition.field.null:
-            kwargs['required'] = False
-
-        formfield = definition.formfield(**kwargs)
-
+    def _clean(self, clean, value):
         # special case for ``None`` values since all form fields seem to handle
         # the conversion differently. simply ignore the cleaning if ``None``,
         # this scenario occurs when a list of values are being queried and one
@@ -77,14 +249,66 @@ class Translator(object):
             new_value = []
             for x in value:
                 if x is not None:
-                    new_value.append(formfield.clean(x))
+                    new_value.append(clean(x))
                 # Django assumes an empty string when given a ``NoneType``
                 # for char-based form fields, this is to ensure ``NoneType``
                 # are passed through unmodified
                 else:
                     new_value.append(None)
             return new_value
-        return formfield.clean(value)
+        return clean(value)
+
+    def _get_formfield(self, definition, **kwargs):
+        if self.form_class:
+            kwargs.setdefault('form_class', self.form_class)
+
+        # TODO since None is considered an empty value by the django validators
+        # ``required`` has to be set to False to not raise a ValidationError
+        # saying the field is required. There may be a need to more explicitly
+        # check to see if the value be passed is only None and not any of the
+        # other empty values in ``django.core.validators.EMPTY_VALUES``
+        if definition.field.null:
+            kwargs['required'] = False
+
+        return definition.formfield(**kwargs)
+
+    def get_validator(self, definition):
+        """Returns a function which cleans a value or list of values for the
+        definition. The common datatypes are coerced directly, otherwise the
+        formfield for the datatype is built once and reused for subsequent
+        calls with the same definition.
+        """
+        validators = definition.metadata.validators
+
+        if self in validators:
+            return validators[self]
+
+        clean = get_coercion(definition)
+
+        if clean is None:
+            kwargs = {}
+
+            if definition.field.null:
+                kwargs['required'] = False
+
+            # the choices widget is not needed for cleaning
+            form_class = definition.metadata.form_class
+            if form_class is not None:
+                kwargs['form_class'] = form_class
+
+            clean = definition.field.formfield(**kwargs).clean
+
+        validators[self] = lambda value: self._clean(clean, value)
+        return validators[self]
+
+    def _validate_value(self, definition, value, **kwargs):
+        # a custom ``form_class`` or formfield arguments may result in
+        # formfields that are not safe to reuse, so a new one is built
+        if self.form_class or kwargs:
+            formfield = self._get_formfield(definition, **kwargs)
+            return self._clean(formfield.clean, value)
+
+        return self.get_validator(definition)(value)
 
     def _get_not_null_pk(self, definition, using):
         # XXX the below logic is required to get the expected results back
@@ -103,17 +327,21 @@ class Translator(object):
         if definition.field.primary_key:
             return Q()
 
-        from avocado.meta.models import Definition
         name = definition.model._meta.pk.name
 
-        # instantiate a new object to utilize the shortcut methods
-        _definition = Definition(app_name=definition.app_name,
-            model_name=definition.model_name, field_name=name)
-
-        key = _definition.query_string('isnull', using=using)
+        key = query_strings.get(definition.app_name, definition.model_name,
+            name, 'isnull', using=using)
 
         return Q(**{key: False})
 
+    def _in_list(self, definition, value):
+        # lists larger than the threshold are compiled into a subquery rather
+        # than a parameter per value
+        if LARGE_IN_LIST_THRESHOLD is not None and \
+            len(value) > LARGE_IN_LIST_THRESHOLD:
+            return LargeInList(value)
+        return value
+
     def _condition(self, definition, operator, value, using):
         # assuming the operator and value validate, check for a NoneType value
         # if the operator is 'in'. This condition will be broken out into a
@@ -138,6 +366,7 @@ class Translator(object):
             # them here
             if value:
                 key = definition.query_string(operator.operator, using=using)
+                value = self._in_list(definition, value)
                 condition = Q(**{key: value}) | condition
 
         else:
@@ -158,6 +387,10 @@ class Translator(object):
             # handle all other conditions
             else:
                 key = definition.query_string(operator.operator, using=using)
+
+                if operator.operator == 'in':
+                    value = self._in_list(definition, value)
+
                 condition = Q(**{key: value}) & self._get_not_null_pk(definition, using)
 
                 condition = ~condition if operator.negated else condition
@@ -188,6 +421,9 @@ class Translator(object):
         operator, value = self.validate(definition, roperator, rvalue, **context)
         condition = self._condition(definition, operator, value, using)
 
+        return self._meta(condition, operator, value, roperator, rvalue)
+
+    def _meta(self, condition, operator, value, roperator, rvalue):
         meta = {
             'condition': condition,
             'annotations': {},
@@ -203,9 +439,82 @@ class Translator(object):
 
         return meta
 
+    def _overrides(self, name):
+        "Returns True if the method ``name`` is overridden by a subclass."
+        return getattr(self.__class__, name).im_func is not \
+            getattr(Translator, name).im_func
+
+    def translate_many(self, conditions, using=None, **context):
+        """Translates a list of (definition, operator, value) conditions and
+        returns a list of the meta dicts in the same order as ``translate``.
+        The operator and value validator are resolved once for each
+        definition and operator.
+        """
+        # translators customizing the validation or meta are called for
+        # each condition
+        if self._overrides('translate') or self._overrides('validate'):
+            return [self.translate(definition, roperator, rvalue, using,
+                **context) for definition, roperator, rvalue in conditions]
+
+        # the compiled validator is only used if the value cleaning is not
+        # customized. the operator and condition hooks are always called
+        # through ``self`` below
+        custom_clean = bool(self.form_class) or \
+            self._overrides('_validate_value')
+
+        groups = {}
+        metas = []
+
+        for definition, roperator, rvalue in conditions:
+            key = (definition.natural_key(), roperator)
+
+            if key not in groups:
+                operator = self._validate_operator(definition, roperator)
+
+                if custom_clean:
+                    clean = partial(self._validate_value, definition)
+                else:
+                    clean = self.get_validator(definition)
+
+                groups[key] = (operator, clean)
+
+            operator, clean = groups[key]
+            value = clean(rvalue)
+
+            if not operator.check(value):
+                raise ValidationError('"%s" is not valid for the operator "%s"' %
+                    (value, operator))
+
+            condition = self._condition(definition, operator, value, using)
+            metas.append(self._meta(condition, operator, value, roperator,
+                rvalue))
+
+        return metas
+
+
+def translate_many(conditions, using=None, **context):
+    """Translates a list of (definition, operator, value) conditions using the
+    translator of each definition. The meta dicts are returned in the same
+    order as the conditions.
+    """
+    groups = {}
+
+    for i, condition in enumerate(conditions):
+        groups.setdefault(condition[0].translator, []).append(i)
+
+    metas = [None] * len(conditions)
+
+    for name, indexes in groups.iteritems():
+        trans = registry[name]
+        subset = [conditions[i] for i in indexes]
+
+        for i, meta in zip(indexes, trans.translate_many(subset, using,
+            **context)):
+            metas[i] = meta
+
+    return metas
 
-registry = loader.Registry(default=Translator)
 
-# this will be invoked when it is imported by models.py to use the
-# registry choices
-loader.autodiscover('translators')
+# the translators modules of the installed apps are discovered on the first
+# lookup, e.g. when models.py uses the registry choices
+registry = loader.Registry(default=Translator, module_name='translators')
@@ -1,5 +1,148 @@
+import calendar
+from datetime import datetime
+from django.db import transaction, connections
+from django.db.models import Count, Min, Max
+from django.db.models.fields import FieldDoesNotExist
+from django.utils.encoding import smart_unicode
+
+from avocado.utils import loader
+
+# numpy is optional, but enables vectorized sampling and binning of large
+# distributions. it is only imported when used
+numpy = loader.lazy_import('numpy')
+
+# the distribution size at which sampling is vectorized if numpy is available
+VECTORIZE_THRESHOLD = 1000
+
+# sql expressions converting date and datetime columns into seconds since
+# the epoch per database vendor. dates cannot be binned in the database for
+# other vendors
+EPOCH_EXPRESSIONS = {
+    'postgresql': 'EXTRACT(EPOCH FROM %s)',
+    'mysql': "TIMESTAMPDIFF(SECOND, '1970-01-01', %s)",
+    'sqlite': '((julianday(%s) - 2440587.5) * 86400.0)',
+}
+
+def _exclude(dist, name, exclude):
+    "Excludes the values in ``exclude`` from the queryset."
+    exclude = set(exclude)
+
+    # special case for null values
+    if None in exclude:
+        dist = dist.exclude(**{'%s__isnull' % name: True})
+        exclude.remove(None)
+
+    if exclude:
+        dist = dist.exclude(**{'%s__in' % name: exclude})
+    return dist
+
+def _sample_python(self, dist, smooth, max_points):
+    minx = dist.pop(0)
+    maxx = dist.pop()
+
+    if self.datatype == 'number' and smooth > 0:
+        maxy = dist[0][1]
+        for x, y in dist[1:]:
+            maxy = max(y, maxy)
+        maxy = float(maxy)
+        smooth_dist  = []
+        for x, y in dist:
+            if y / maxy >= smooth:
+                smooth_dist.append((x, y))
+        dist = smooth_dist
+
+    if max_points is not None:
+        # TODO faster to do count or len?
+        dist_len = len(dist)
+        step = int(dist_len/float(max_points))
+
+        if step > 1:
+            # we can safely assume that this is NOT categorical data when
+            # ``max_points`` is set and/or the condition where the count will
+            # be greater than max_points will usually never be true
+
+            # sample by step value
+            dist = dist[::step]
+
+    dist.insert(0, minx)
+    dist.append(maxx)
+
+    return tuple(dist)
+
+def _sample_numpy(self, dist, smooth, max_points):
+    """Equivalent to ``_sample_python``, but smooths and samples an array of
+    indexes into ``dist`` rather than the list of pairs itself.
+    """
+    size = len(dist) - 2
+    index = numpy.arange(1, size + 1)
+
+    if self.datatype == 'number' and smooth > 0:
+        counts = numpy.fromiter((y for x, y in dist[1:-1]), dtype=float,
+            count=size)
+        index = index[counts / counts.max() >= smooth]
+
+    if max_points is not None:
+        step = int(len(index) / float(max_points))
+        if step > 1:
+            index = index[::step]
+
+    return tuple([dist[0]] + [dist[i] for i in index] + [dist[-1]])
+
+def _sample(self, dist, smooth, max_points):
+    """Smooths and samples an ordered list of (value, count) pairs. The min
+    and max values are always included.
+    """
+    if len(dist) < 3:
+        return tuple(dist)
+
+    if numpy is not None and len(dist) >= VECTORIZE_THRESHOLD:
+        return _sample_numpy(self, dist, smooth, max_points)
+    return _sample_python(self, dist, smooth, max_points)
+
+def _bin(self, dist, bins, max_points):
+    """Bins a numeric distribution into at most ``max_points`` ``fixed``
+    width or ``quantile`` bins. Quantile bins contain roughly the same
+    number of rows. Returns (lower bound, count) pairs, NULL values are
+    ignored.
+    """
+    if numpy is None:
+        raise ImportError, 'numpy is required for binned distributions'
+    if bins not in ('fixed', 'quantile'):
+        raise ValueError, 'unknown bins "%s"' % bins
+
+    dist = [(x, y) for x, y in dist if x is not None]
+    if not dist:
+        return ()
+
+    values = numpy.array([x for x, y in dist], dtype=float)
+    counts = numpy.array([y for x, y in dist], dtype=float)
+    nbins = max_points or len(dist)
+
+    if bins == 'fixed':
+        edges = nbins
+    else:
+        order = values.argsort()
+        values, counts = values[order], counts[order]
+
+        # each bin ends after the value at which a quantile of the
+        # cumulative count falls
+        cumulative = counts.cumsum()
+        quantiles = numpy.linspace(0, cumulative[-1], nbins + 1)[1:-1]
+        index = numpy.minimum(cumulative.searchsorted(quantiles) + 1,
+            len(values) - 1)
+        inner = values[index]
+
+        edges = numpy.unique(numpy.concatenate(([values[0]], inner,
+            [values[-1]])))
+
+        if len(edges) < 2:
+            return ((float(edges[0]), int(counts.sum())),)
+
+    hist, edges = numpy.histogram(values, bins=edges, weights=counts)
+    return tuple((float(x), int(y)) for x, y in zip(edges[:-1], hist))
+
 def distribution(self, exclude=[], min_count=None, max_points=20,
-    order_by='field', smooth=0.01, annotate_by='id', **filters):
+    order_by='field', smooth=0.01, annotate_by='id', bins=None, **filters):
 
     """Builds a GROUP BY queryset for use as a value distribution.
 
@@ -23,6 +166,10 @@ def distribution(self, exclude=[], min_count=None, max_points=20,
     ``order_by`` - specify an ordering for the distribution. the choices are
     'count', 'field', or None. default is 'count'
 
+    ``bins`` - for numeric definitions, either 'fixed' or 'quantile' to bin
+    the distribution into at most ``max_points`` bins rather than sampling
+    it. requires numpy
+
     ``filters`` - a dict of filters to be applied to the queryset before
     the count annotation.
     """
@@ -33,16 +180,7 @@ def distribution(self, exclude=[], min_count=None, max_points=20,
 
     # exclude certain values (e.g. None, '')
     if exclude:
-        exclude = set(exclude)
-        kwargs = {}
-
-        # special case for null values
-        if None in exclude:
-            kwargs['%s__isnull' % name] = True
-            exclude.remove(None)
-
-        kwargs['%s__in' % name] = exclude
-        dist = dist.exclude(**kwargs)
+        dist = _exclude(dist, name, exclude)
 
     # apply filters before annotation is made
     if filters:
@@ -63,40 +201,229 @@ def distribution(self, exclude=[], min_count=None, max_points=20,
     elif order_by == 'field':
         dist = dist.order_by(name)
 
-    dist = list(dist)
+    if bins and self.datatype == 'number':
+        return _bin(self, list(dist), bins, max_points)
+    return _sample(self, list(dist), smooth, max_points)
 
-    if len(dist) < 3:
-        return tuple(dist)
 
-    minx = dist.pop(0)
-    maxx = dist.pop()
+def _to_seconds(value):
+    "Returns the seconds since the epoch for a date or datetime."
+    seconds = calendar.timegm(value.timetuple())
+    if isinstance(value, datetime):
+        seconds += value.microsecond / 1e6
+    return seconds
 
-    if self.datatype == 'number' and smooth > 0:
-        maxy = dist[0][1]
-        for x, y in dist[1:]:
-            maxy = max(y, maxy)
-        maxy = float(maxy)
-        smooth_dist  = []
-        for x, y in dist:
-            if y / maxy >= smooth:
-                smooth_dist.append((x, y))
-        dist = smooth_dist
+def _bucket_sql(vendor, expression, lower, width, nbins):
+    """Returns the SQL and parameters for the zero-based bucket of
+    ``expression``. The maximum value is included in the last bucket.
+    """
+    upper = lower + width * nbins
 
-    if max_points is not None:
-        # TODO faster to do count or len?
-        dist_len = len(dist)
-        step = int(dist_len/float(max_points))
+    if vendor == 'postgresql':
+        sql = 'LEAST(width_bucket(%s, %%s, %%s, %%s), %%s) - 1'
+        params = [lower, upper, nbins, nbins]
+    elif vendor == 'sqlite':
+        sql = 'MIN(CAST((%s - %%s) / %%s AS INTEGER), %%s)'
+        params = [lower, width, nbins - 1]
+    else:
+        sql = 'LEAST(FLOOR((%s - %%s) / %%s), %%s)'
+        params = [lower, width, nbins - 1]
 
-        if step > 1:
-            # we can safely assume that this is NOT categorical data when
-            # ``max_points`` is set and/or the condition where the count will
-            # be greater than max_points will usually never be true
+    return sql % expression, params
 
-            # sample by step value
-            dist = dist[::step]
+def _column(queryset, name):
+    """Returns the quoted column for the field ``name`` qualified by the
+    alias it has in ``queryset``. The joins already set up by the filters
+    are reused, e.g. for fields inherited from a parent model.
+    """
+    query = queryset.query
+    qn = connections[queryset.db].ops.quote_name
 
-    dist.insert(0, minx)
-    dist.append(maxx)
+    field, target, opts, joins, last, extra = query.setup_joins([name],
+        query.get_meta(), query.get_initial_alias(), False)
 
-    return tuple(dist)
+    return '%s.%s' % (qn(joins[-1]), qn(target.column))
+
+def binned_distribution(self, exclude=[], max_points=20, **filters):
+    """Bins the distribution of a number, date or datetime definition into
+    at most ``max_points`` equal width bins in the database. Returns (lower
+    bound, count) pairs, NULL values are ignored. ``None`` is returned if
+    the datatype cannot be binned by the database.
+    """
+    model = self.model
+    name = str(self.field_name)
+    pk = model._meta.pk.name
+
+    queryset = model.objects.filter(**{'%s__isnull' % name: False})
+
+    if exclude:
+        queryset = _exclude(queryset, name, exclude)
+
+    if filters:
+        queryset = queryset.filter(**filters)
+
+    connection = connections[queryset.db]
+
+    # the query is modified when resolving the column
+    queryset = queryset._clone()
+    column = _column(queryset, name)
+
+    if self.datatype == 'number':
+        expression = column
+        to_number = float
+        from_number = float
+    elif self.datatype in ('date', 'datetime'):
+        if connection.vendor not in EPOCH_EXPRESSIONS:
+            return
+        expression = EPOCH_EXPRESSIONS[connection.vendor] % column
+        to_number = _to_seconds
+        if self.datatype == 'date':
+            from_number = lambda x: datetime.utcfromtimestamp(x).date()
+        else:
+            from_number = datetime.utcfromtimestamp
+    else:
+        return
+
+    bounds = queryset.aggregate(lower=Min(name), upper=Max(name))
+
+    if bounds['lower'] is None:
+        return ()
+
+    lower = to_number(bounds['lower'])
+    upper = to_number(bounds['upper'])
+
+    if lower == upper:
+        return ((from_number(lower), queryset.count()),)
+
+    width = (upper - lower) / float(max_points)
+    sql, params = _bucket_sql(connection.vendor, expression, lower, width,
+        max_points)
+
+    dist = queryset.extra(select={'bucket': sql}, select_params=params)\
+        .values('bucket')\
+        .annotate(count=Count(pk)).values_list('bucket', 'count')\
+        .order_by('bucket')
+
+    return tuple((from_number(lower + int(x) * width), y) for x, y in dist)
+
+
+def _encode_value(value):
+    "Encodes a value for storage. ``repr`` retains the precision of floats."
+    if value is None:
+        return None
+    if isinstance(value, float):
+        return repr(value)
+    return smart_unicode(value)
+
+def stored_distribution(self, exclude=[], min_count=None, max_points=20,
+    order_by='field', smooth=0.01, bins=None):
+    """Equivalent to ``distribution``, but uses the stored distribution for
+    the definition rather than querying the source table. Returns ``None``
+    if the distribution has not been stored.
+    """
+    from avocado.meta.models import Distribution
+
+    # binning the stored values requires numpy, whereas fixed width bins can
+    # still be computed by the database when querying the source table
+    if bins and self.datatype == 'number' and numpy is None:
+        return
+
+    try:
+        stored = Distribution.objects.get(definition=self,
+            refreshed__isnull=False)
+    except Distribution.DoesNotExist:
+        return
+
+    to_python = self.field.to_python
+
+    dist = []
+    for value, count in stored.values.values_list('value', 'count'):
+        if value is not None:
+            value = to_python(value)
+        dist.append((value, count))
+
+    if exclude:
+        exclude = set(exclude)
+        dist = [(x, y) for x, y in dist if x not in exclude]
+
+    if min_count is not None and min_count > 0:
+        dist = [(x, y) for x, y in dist if y >= min_count]
+
+    if order_by == 'count':
+        dist.sort(key=lambda x: x[1])
+    elif order_by == 'field':
+        # NULL values are ordered the same as when querying the source
+        # table, i.e. last on PostgreSQL and Oracle and first otherwise
+        vendor = connections[self.model._default_manager.db].vendor
+        nulls_last = vendor in ('postgresql', 'oracle')
+        dist.sort(key=lambda x: ((x[0] is None) == nulls_last, x[0]))
+
+    if bins and self.datatype == 'number':
+        return _bin(self, dist, bins, max_points)
+    return _sample(self, dist, smooth, max_points)
+
+@transaction.commit_on_success
+def refresh_distribution(self, full=False, modified_field='modified'):
+    """Stores the value distribution of the definition. Subsequent refreshes
+    are incremental if the model has a ``modified_field``, that is only the
+    counts of the values of rows modified since the last refresh are
+    recomputed. Since the previous values of updated rows and deleted rows
+    are not known, a ``full`` refresh should be performed periodically.
+
+    Returns the number of values that were refreshed.
+    """
+    from avocado.meta.models import Distribution, DistributionValue
+
+    model = self.model
+    name = str(self.field_name)
+    pk = model._meta.pk.name
+
+    stored, created = Distribution.objects.get_or_create(definition=self)
+
+    # the timestamp is taken prior to reading the data, so rows modified
+    # during the refresh will be included in the next refresh
+    now = datetime.now()
+
+    queryset = model.objects.all()
+
+    try:
+        model._meta.get_field_by_name(modified_field)
+        incremental = not full and stored.refreshed is not None
+    except FieldDoesNotExist:
+        incremental = False
+
+    if incremental:
+        values = set(queryset.filter(**{'%s__gte' % modified_field:
+            stored.refreshed}).values_list(name, flat=True).distinct())
+
+        # only the values of the modified rows are recounted
+        stale = stored.values.none()
+        dist = queryset.none()
+
+        if None in values:
+            values.remove(None)
+            stale = stored.values.filter(value__isnull=True)
+            dist = queryset.filter(**{'%s__isnull' % name: True})
+
+        if values:
+            stale = stale | stored.values.filter(value__in=[_encode_value(x)
+                for x in values])
+            dist = dist | queryset.filter(**{'%s__in' % name: values})
+
+        stale.delete()
+    else:
+        stored.values.all().delete()
+        dist = queryset
+
+    dist = dist.values(name).annotate(count=Count(pk)).values_list(name,
+        'count').order_by()
+
+    objs = [DistributionValue(distribution=stored, value=_encode_value(x),
+        count=y) for x, y in dist]
+
+    DistributionValue.objects.bulk_create(objs)
+
+    stored.refreshed = now
+    stored.save()
 
+    return len(objs)
@@ -1,2 +1,7 @@
 from avocado.tests.meta.models import *
 from avocado.tests.meta.translators import *
+from avocado.tests.meta.exporters import *
+from avocado.tests.meta.formatters import *
+from avocado.tests.meta.logictree import *
+from avocado.tests.utils.loader import *
+from avocado.tests.commands import *
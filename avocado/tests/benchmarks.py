@@ -0,0 +1,114 @@
+"""Simple benchmarks for comparing the performance of alternate code paths.
+These are not run as part of the test suite since they require a populated
+database. Run them from a configured project shell, e.g.::
+
+    >>> from avocado.tests import benchmarks
+    >>> benchmarks.export_rows(Patient.objects.all(), concepts)
+"""
+import time
+from django.db import connection, reset_queries
+from django.conf import settings
+
+def _timeit(func, *args, **kwargs):
+    "Returns the elapsed time and number of queries performed by ``func``."
+    debug = settings.DEBUG
+    settings.DEBUG = True
+    reset_queries()
+
+    start = time.time()
+    func(*args, **kwargs)
+    elapsed = time.time() - start
+
+    nqueries = len(connection.queries)
+    settings.DEBUG = debug
+
+    return elapsed, nqueries
+
+def _report(name, nrows, elapsed, nqueries):
+    print '%s: %.1f us/row, %.2f queries/row (%d rows)' % (name,
+        elapsed / nrows * 1e6, nqueries / float(nrows), nrows)
+
+def export_rows(queryset, concepts, limit=1000):
+    """Compares the per-row cost of formatting exported rows by looking up
+    the concept definitions for every row versus using a compiled
+    ``RowPlan``.
+    """
+    from avocado.meta.exporters import CSVExporter
+
+    exporter = CSVExporter(queryset, concepts)
+    plan = exporter.get_plan()
+    rows = list(exporter._get_raw_query(plan.fields, exporter.queryset[:limit]))
+
+    formatters = [(c, c.get_formatter(exporter.preferred_formats))
+        for c in concepts]
+
+    def per_row_lookup():
+        for row in rows:
+            for c, f in formatters:
+                data, row = row[:f.length], row[f.length:]
+                f(c.get_formatter_values(data), c)
+
+    def compiled_plan():
+        for row in rows:
+            list(plan(row))
+
+    _report('per-row lookup', len(rows), *_timeit(per_row_lookup))
+    _report('compiled plan', len(rows), *_timeit(compiled_plan))
+
+def sample_distribution(sizes=(10**3, 10**4, 10**5, 10**6, 10**7),
+    smooth=0.01, max_points=20):
+    """Compares smoothing and sampling synthetic numeric distributions of
+    increasing size in pure Python versus NumPy.
+    """
+    import random
+    from avocado.meta import utils
+
+    class definition(object):
+        datatype = 'number'
+
+    for size in sizes:
+        dist = [(i, random.randint(1, 1000)) for i in xrange(size)]
+
+        for name, func in (('python', utils._sample_python),
+            ('numpy', utils._sample_numpy)):
+
+            copy = list(dist)
+            start = time.time()
+            func(definition, copy, smooth, max_points)
+            elapsed = time.time() - start
+
+            print '%s: %.3f s (%d values)' % (name, elapsed, size)
+
+def translate_conditions(conditions, repeat=10):
+    """Compares translating a list of (definition, operator, value)
+    conditions one at a time versus using ``translate_many``.
+    """
+    from avocado.meta import translators
+
+    conditions = list(conditions) * repeat
+
+    def single():
+        for definition, operator, value in conditions:
+            definition.translate(operator, value)
+
+    def batched():
+        translators.translate_many(conditions)
+
+    _report('translate', len(conditions), *_timeit(single))
+    _report('translate_many', len(conditions), *_timeit(batched))
+
+def sync(*labels, **kwargs):
+    """Reports the time and number of queries used by ``avocado sync`` for
+    the app or model ``labels``. By default the command is run with
+    ``--dry-run``, so nothing is saved. Pass ``dry_run=False`` to include
+    the inserts. The command commits its own transaction, so only do this
+    against a throwaway database.
+    """
+    from django.core.management import call_command
+
+    dry_run = kwargs.get('dry_run', True)
+
+    elapsed, nqueries = _timeit(call_command, 'avocado', 'sync', *labels,
+        verbosity=0, dry_run=dry_run)
+
+    print 'sync: %.3f s, %d queries' % (elapsed, nqueries)
@@ -0,0 +1,24 @@
+from django.test import TestCase
+from avocado.management.commands import avocado
+
+__all__ = ('AvocadoCommandTestCase',)
+
+class AvocadoCommandTestCase(TestCase):
+    def test_subcommand_name(self):
+        calls = []
+
+        def call_command(*args, **options):
+            calls.append(args)
+
+        original = avocado.call_command
+        avocado.call_command = call_command
+
+        try:
+            avocado.Command().handle('profile-startup', 'avocado.conf')
+            avocado.Command().handle('sync', 'tests')
+        finally:
+            avocado.call_command = original
+
+        # hyphens are mapped to the underscores of the command modules
+        self.assertEqual(calls, [('profile_startup', 'avocado.conf'),
+            ('sync', 'tests')])
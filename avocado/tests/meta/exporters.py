@@ -0,0 +1,234 @@
+from datetime import datetime
+from cStringIO import StringIO
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.utils import unittest
+from django.core.management import call_command
+from avocado.meta.models import Definition
+from avocado.meta import exporters
+from avocado.meta.exporters import CSVExporter, NDJSONExporter, \
+    NumPyExporter, registry, export
+from avocado.utils.loader import NotRegistered
+from avocado.tests.models import Office, Employee, Meeting
+
+__all__ = ('ExporterTestCase', 'ParallelExporterTestCase')
+
+class ExporterTestCase(TestCase):
+
+    def setUp(self):
+        call_command('avocado', 'sync', 'tests', verbosity=0)
+
+        office = Office(location='Philadelphia')
+        office.save()
+
+        for i in xrange(50):
+            Employee(first_name='Robert %d' % i, last_name='Smith',
+                office=office).save()
+
+        first_name = Definition.objects.get_by_natural_key('tests',
+            'employee', 'first_name')
+        last_name = Definition.objects.get_by_natural_key('tests',
+            'employee', 'last_name')
+
+        self.concepts = [first_name.create_concept(save=True),
+            last_name.create_concept(save=True)]
+
+        self.exporter = CSVExporter(Employee.objects.order_by('id'),
+            self.concepts)
+
+    def test_header(self):
+        self.assertEqual(self.exporter.header(), ['First Name', 'Last Name'])
+
+    def test_stream(self):
+        chunks = list(self.exporter.stream(chunk_size=128))
+
+        # the export is broken up into multiple chunks of roughly the
+        # requested size
+        self.assertTrue(len(chunks) > 1)
+        for chunk in chunks[:-1]:
+            self.assertTrue(len(chunk) < 128 + 64)
+
+        lines = ''.join(chunks).splitlines()
+        self.assertEqual(len(lines), 51)
+        self.assertEqual(lines[0], 'First Name,Last Name')
+        self.assertEqual(lines[1], 'Robert 0,Smith')
+
+    def test_export(self):
+        buff = self.exporter.export(StringIO())
+        self.assertEqual(buff.getvalue(), ''.join(self.exporter.stream()))
+
+    def test_batched_read(self):
+        # keyset pagination is used for non-PostgreSQL backends. batch sizes
+        # which do and do not evenly divide the number of rows are tested
+        expected = ''.join(self.exporter.stream())
+        for batch_size in (10, 7, 100):
+            self.assertEqual(''.join(self.exporter.stream(
+                batch_size=batch_size)), expected)
+
+    def test_batched_read_to_many(self):
+        # each employee attends two meetings, so each employee has two rows
+        # which straddle the boundaries of odd batch sizes
+        office = Office.objects.get()
+        for hour in (9, 13):
+            meeting = Meeting(office=office,
+                start_time=datetime(2012, 1, 1, hour))
+            meeting.save()
+            meeting.attendees = Employee.objects.all()
+
+        start_time = Definition.objects.get_by_natural_key('tests',
+            'meeting', 'start_time')
+        concepts = [self.concepts[0], start_time.create_concept(save=True)]
+
+        exporter = CSVExporter(Employee.objects.order_by('id'), concepts)
+        expected = sorted(''.join(exporter.stream()).splitlines())
+        self.assertEqual(len(expected), 101)
+
+        for batch_size in (7, 100):
+            lines = ''.join(exporter.stream(batch_size=batch_size))\
+                .splitlines()
+            self.assertEqual(sorted(lines), expected)
+
+    def test_plan(self):
+        plan = self.exporter.get_plan()
+
+        self.assertEqual(plan.header, ['First Name', 'Last Name'])
+        self.assertEqual([f.name for f in plan.fields], ['first_name',
+            'last_name'])
+
+        # once the plan is compiled, the only query is the one for the data
+        with self.assertNumQueries(1):
+            for row_gen in self.exporter.read(plan=plan):
+                list(row_gen)
+
+        # when reading in batches, each batch costs one query for the
+        # primary keys and one for the rows regardless of the number of
+        # rows or concepts. the last batch of 10 is followed by an empty one
+        with self.assertNumQueries(11):
+            for row_gen in self.exporter.read(plan=plan, batch_size=10):
+                list(row_gen)
+
+        with self.assertNumQueries(11):
+            rows = list(self.exporter._format_rows(plan,
+                self.exporter._iter_rows(plan.fields, batch_size=10)))
+        self.assertEqual(len(rows), 50)
+
+        # 7 full batches and a partial one, which ends the iteration
+        with self.assertNumQueries(16):
+            list(self.exporter._format_rows(plan,
+                self.exporter._iter_rows(plan.fields, batch_size=7)))
+
+        data = list(plan(('Robert', 'Smith')))
+        self.assertEqual(data[0]['first_name']['value'], 'Robert')
+        self.assertEqual(data[1]['last_name']['name'], 'Last Name')
+
+    def test_pk_ranges(self):
+        # sparse primary keys do not result in empty ranges
+        Employee.objects.filter(id__in=range(5, 45)).delete()
+        pks = list(Employee.objects.values_list('id', flat=True)\
+            .order_by('id'))
+        self.assertEqual(len(pks), 10)
+
+        ranges = list(self.exporter._pk_ranges(4))
+        self.assertEqual(ranges, [(pks[0], pks[4]), (pks[4], pks[8]),
+            (pks[8], None)])
+
+        # a range which ends exactly at the last key is followed by an
+        # open-ended range
+        self.assertEqual(list(self.exporter._pk_ranges(5)),
+            [(pks[0], pks[5]), (pks[5], None)])
+        self.assertEqual(list(self.exporter._pk_ranges(100)), [(pks[0], None)])
+
+        exporter = CSVExporter(Employee.objects.filter(last_name='Jones'),
+            self.concepts)
+        self.assertEqual(list(exporter._pk_ranges(4)), [])
+
+    def test_export_range(self):
+        # the ranges are exported in-process since the worker processes
+        # cannot access an in-memory database
+        Employee.objects.filter(id__in=range(5, 45)).delete()
+
+        plan = self.exporter.get_plan()
+        expected = list(self.exporter._format_rows(plan,
+            self.exporter._iter_rows(plan.fields)))
+
+        rows = []
+        for task in self.exporter._parallel_tasks(3):
+            rows.extend(exporters._export_range(task))
+        self.assertEqual(rows, expected)
+
+    def test_parallel_transaction(self):
+        # the test runs within a managed transaction, so the export falls
+        # back to a single process and the connection is left open
+        expected = ''.join(self.exporter.stream())
+        self.assertEqual(''.join(self.exporter.stream(workers=2)), expected)
+        self.assertTrue(connection.connection is not None)
+
+    def test_registry(self):
+        self.assertTrue(isinstance(registry[None], CSVExporter))
+
+        # discovered on the first lookup
+        self.assertTrue(registry.discovered)
+        self.assertTrue(registry.stats['modules'] > 0)
+        self.assertTrue(isinstance(registry['ndjson'], NDJSONExporter))
+
+        exporter = registry['csv'](Employee.objects.all(), self.concepts)
+        self.assertTrue(isinstance(exporter, CSVExporter))
+        self.assertEqual(exporter.concepts, self.concepts)
+
+    def test_export_unknown(self):
+        self.assertFalse('xlsx' in registry)
+        self.assertRaises(NotRegistered, export, None,
+            Employee.objects.all(), self.concepts, name='xlsx')
+
+    @unittest.skipIf(exporters.numpy is None, 'requires numpy')
+    def test_npz(self):
+        cdef = self.concepts[0].conceptdefinitions.get()
+        cdef.name = 'First/Name'
+        cdef.save()
+
+        exporter = NumPyExporter(Employee.objects.order_by('id'),
+            self.concepts)
+        exporter.block_size = 7
+
+        buff = StringIO(exporter.export(StringIO()).getvalue())
+        columns = NumPyExporter.load(buff)
+        self.assertEqual(columns.keys(), ['First_Name', 'Last Name'])
+        self.assertEqual(len(columns['First_Name']), 50)
+        self.assertEqual(columns['First_Name'][49], 'Robert 49')
+
+    def test_ndjson(self):
+        exporter = NDJSONExporter(Employee.objects.order_by('id'),
+            self.concepts)
+        lines = ''.join(exporter.stream(chunk_size=128)).splitlines()
+
+        self.assertEqual(len(lines), 50)
+        self.assertEqual(lines[0],
+            '{"First Name": "Robert 0", "Last Name": "Smith"}')
+
+
+class ParallelExporterTestCase(TransactionTestCase):
+    def setUp(self):
+        call_command('avocado', 'sync', 'tests', verbosity=0)
+
+        office = Office(location='Philadelphia')
+        office.save()
+
+        for i in xrange(50):
+            Employee(first_name='Robert %d' % i, last_name='Smith',
+                office=office).save()
+
+        first_name = Definition.objects.get_by_natural_key('tests',
+            'employee', 'first_name')
+        self.concepts = [first_name.create_concept(save=True)]
+
+    # the worker processes cannot access an in-memory database
+    @unittest.skipIf(connection.vendor == 'sqlite',
+        'requires a database accessible from other processes')
+    def test_parallel(self):
+        exporter = CSVExporter(Employee.objects.order_by('id'),
+            self.concepts)
+        expected = ''.join(exporter.stream())
+
+        # ranges of 7 keys do not evenly divide the rows
+        self.assertEqual(''.join(exporter.stream(workers=2, batch_size=7)),
+            expected)
@@ -0,0 +1,79 @@
+from collections import OrderedDict
+from django.test import TestCase
+from avocado.meta.formatters import Formatter
+
+__all__ = ('FormatterTestCase',)
+
+class Definition(object):
+    "Stand-in for a Definition since only the datatype is accessed."
+    def __init__(self, datatype):
+        self.datatype = datatype
+
+
+class Concept(object):
+    name = 'Concept'
+
+
+class FormatterTestCase(TestCase):
+    def setUp(self):
+        self.formatter = Formatter()
+        self.concept = Concept()
+
+        self.columns = OrderedDict([
+            ('name', {
+                'name': 'Name',
+                'values': ['Bob', None, u'Jos\xe9'],
+                'definition': Definition('string'),
+            }),
+            ('age', {
+                'name': 'Age',
+                'values': [30, 45, 60],
+                'definition': Definition('number'),
+            }),
+            ('salary', {
+                'name': 'Salary',
+                'values': [1.5, None, 1e20],
+                'definition': Definition('number'),
+            }),
+        ])
+
+    def _format_rows(self, choice):
+        "Formats each row independently for comparison."
+        columns = self.columns.values()
+        out = []
+        for i in xrange(3):
+            values = OrderedDict()
+            for key, column in self.columns.iteritems():
+                values[key] = {
+                    'name': column['name'],
+                    'value': column['values'][i],
+                    'definition': column['definition'],
+                }
+            out.append(self.formatter(values, self.concept, choice=choice))
+        return out
+
+    def test_batch_string(self):
+        out = self.formatter.format_batch(self.columns, self.concept, 'string')
+        rows = self._format_rows('string')
+
+        self.assertEqual(out.keys(), ['name', 'age', 'salary'])
+
+        for key, column in out.iteritems():
+            self.assertEqual(column['values'],
+                [row[key]['value'] for row in rows])
+
+    def test_batch_noop(self):
+        out = self.formatter.format_batch(self.columns, self.concept)
+        self.assertEqual(out['age']['values'], [30, 45, 60])
+
+    def test_batch_multiple(self):
+        out = self.formatter.format_batch(self.columns, self.concept, 'html')
+        rows = self._format_rows('html')
+
+        self.assertEqual(out.keys(), rows[0].keys())
+        self.assertEqual(out['name']['values'],
+            [row['name']['value'] for row in rows])
+
+    def test_unsupported(self):
+        self.assertRaises(AttributeError, self.formatter.format_batch,
+            self.columns, self.concept, 'foo')
@@ -0,0 +1,257 @@
+from django.test import TestCase
+from django.db.models import Q
+from django.core.management import call_command
+from avocado.conf import settings
+from avocado.meta.models import Definition
+from avocado.meta import logictree, counts, translators
+from avocado.tests.models import Office, Title, Employee
+
+__all__ = ('LogicTreeTestCase', 'OptimizeTestCase')
+
+class LogicTreeTestCase(TestCase):
+    def setUp(self):
+        call_command('avocado', 'sync', 'tests', verbosity=0)
+
+        self.first_name = Definition.objects.get_by_natural_key('tests',
+            'employee', 'first_name')
+        self.salary = Definition.objects.get_by_natural_key('tests',
+            'title', 'salary')
+
+        self.concept = self.first_name.create_concept(save=True)
+
+    def _tree(self, n):
+        children = []
+        for i in xrange(n):
+            children.append({
+                'id': self.first_name.id,
+                'concept_id': self.concept.id,
+                'operator': 'exact',
+                'value': 'Robert %d' % i,
+            })
+            children.append({
+                'id': self.salary.id,
+                'concept_id': None,
+                'operator': 'gt',
+                'value': i * 1000,
+            })
+        return {'type': 'OR', 'children': children}
+
+    def test_resolve(self):
+        # the number of queries is constant relative to the tree size, i.e.
+        # one each for the concept definitions, concepts and the remaining
+        # definitions
+        with self.assertNumQueries(3):
+            node = logictree.transform(self._tree(20))
+
+        conditions = node.get_conditions()
+        self.assertEqual(len(conditions), 40)
+
+        with self.assertNumQueries(0):
+            for condition in conditions:
+                condition.definition
+                if condition.concept_id:
+                    condition.concept
+                    condition.conceptdefinition.concept
+
+        self.assertEqual(conditions[0].definition, self.first_name)
+        self.assertEqual(conditions[0].concept, self.concept)
+        self.assertEqual(conditions[1].definition, self.salary)
+
+    def test_single(self):
+        with self.assertNumQueries(1):
+            node = logictree.transform({
+                'id': self.salary.id,
+                'concept_id': None,
+                'operator': 'gt',
+                'value': 1000,
+            })
+        self.assertEqual(node.definition, self.salary)
+
+    def test_query_cache(self):
+        cache = logictree.QueryCache(maxsize=10)
+        tree = self._tree(2)
+
+        node = cache.transform(tree)
+        self.assertEqual(cache.stats['misses'], 1)
+        self.assertEqual(str(node.condition),
+            str(logictree.transform(tree).condition))
+
+        # key order does not matter
+        tree['children'][0] = dict(reversed(tree['children'][0].items()))
+        with self.assertNumQueries(0):
+            cached = cache.transform(tree)
+        self.assertEqual(cache.stats['hits'], 1)
+        self.assertEqual(str(cached.condition), str(node.condition))
+
+        # a different alias or context is a different entry
+        cache.transform(tree, foo=1)
+        self.assertEqual(cache.stats['misses'], 2)
+
+        cache.invalidate(max(self.first_name.id, self.salary.id) + 1000)
+        self.assertEqual(cache.stats['size'], 2)
+
+        cache.invalidate(self.salary.id)
+        self.assertEqual(cache.stats['size'], 0)
+
+    def test_count(self):
+        cache = counts.CountCache(counts.LocalBackend(maxsize=10))
+        queryset = Employee.objects.all()
+
+        tree = self._tree(2)
+        node = logictree.transform(tree)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(cache.count(node, queryset), 0)
+            self.assertEqual(cache.count(node, queryset), 0)
+
+        # the order of the children does not matter
+        tree['children'].reverse()
+        reordered = logictree.transform(tree)
+        with self.assertNumQueries(0):
+            cache.count(reordered, queryset)
+
+        # a different base queryset is a different entry
+        with self.assertNumQueries(1):
+            cache.count(node, queryset.filter(last_name='Smith'))
+
+        cache.invalidate()
+        with self.assertNumQueries(1):
+            cache.count(node, queryset)
+
+
+class OptimizeTestCase(TestCase):
+    def setUp(self):
+        call_command('avocado', 'sync', 'tests', verbosity=0)
+
+        office = Office(location='Philadelphia')
+        office.save()
+
+        for i in xrange(10):
+            title = Title(name='Title %d' % i, salary=i * 10000 or None)
+            title.save()
+            Employee(first_name='Robert %d' % i, last_name='Smith',
+                office=office, title=title, is_manager=bool(i % 2)).save()
+
+        self.first_name = Definition.objects.get_by_natural_key('tests',
+            'employee', 'first_name').id
+        self.salary = Definition.objects.get_by_natural_key('tests',
+            'title', 'salary').id
+        self.is_manager = Definition.objects.get_by_natural_key('tests',
+            'employee', 'is_manager').id
+
+    def _condition(self, id, operator, value):
+        return {'id': id, 'concept_id': None, 'operator': operator,
+            'value': value}
+
+    def _compare(self, tree):
+        "Compares the results of the optimized and unoptimized tree."
+        results = []
+        previous = settings.OPTIMIZE_QUERY_TREES
+        try:
+            for optimize in (False, True):
+                settings.OPTIMIZE_QUERY_TREES = optimize
+                node = logictree.transform(tree)
+                queryset = node.apply(Employee.objects.all())
+                results.append(set(queryset.values_list('pk', flat=True)))
+        finally:
+            settings.OPTIMIZE_QUERY_TREES = previous
+
+        self.assertEqual(results[0], results[1])
+        self.assertTrue(results[1])
+        return node
+
+    def test_merge_exact(self):
+        node = self._compare({'type': 'OR', 'children': [
+            self._condition(self.first_name, 'exact', 'Robert 1'),
+            self._condition(self.first_name, 'exact', 'Robert 2'),
+            {'type': 'OR', 'children': [
+                self._condition(self.first_name, 'exact', 'Robert 3'),
+                self._condition(self.first_name, 'in', ['Robert 1',
+                    'Robert 4']),
+            ]},
+        ]})
+
+        self.assertTrue(isinstance(node, logictree.Condition))
+        self.assertEqual(node.operator, 'in')
+        self.assertEqual(node.value, ['Robert 1', 'Robert 2', 'Robert 3',
+            'Robert 4'])
+
+    def test_text(self):
+        # the text is derived from the concept definitions
+        concept = Definition.objects.get(id=self.first_name)\
+            .create_concept(save=True)
+
+        tree = {'type': 'OR', 'children': []}
+        for value in ('Robert 1', 'Robert 2'):
+            condition = self._condition(self.first_name, 'exact', value)
+            condition['concept_id'] = concept.id
+            tree['children'].append(condition)
+
+        text = logictree.transform(tree).text
+        self.assertEqual(text['conditions'], [
+            u'First Name is equal to <b>Robert 1</b>',
+            u'First Name is equal to <b>Robert 2</b>'])
+
+        node = self._compare(tree)
+        self.assertEqual(node.operator, 'in')
+        self.assertEqual(node.text, text)
+
+    def test_merge_not_permitted(self):
+        # booleans do not support the ``in`` operator
+        node = self._compare({'type': 'OR', 'children': [
+            self._condition(self.is_manager, 'exact', True),
+            self._condition(self.is_manager, 'exact', False),
+        ]})
+        self.assertEqual(len(node.children), 2)
+
+    def test_intersect_ranges(self):
+        node = self._compare({'type': 'AND', 'children': [
+            self._condition(self.salary, 'range', [10000, 50000]),
+            {'type': 'AND', 'children': [
+                self._condition(self.salary, 'range', [20000, 80000]),
+                self._condition(self.first_name, 'icontains', 'robert'),
+            ]},
+        ]})
+
+        self.assertEqual(len(node.children), 2)
+        self.assertEqual(node.children[0].value, [20000, 50000])
+
+    def test_combine_ranges(self):
+        node = self._compare({'type': 'OR', 'children': [
+            self._condition(self.salary, 'range', [10000, 30000]),
+            self._condition(self.salary, 'range', [20000, 40000]),
+            self._condition(self.salary, 'range', [70000, 80000]),
+        ]})
+
+        self.assertEqual([x.value for x in node.children],
+            [[10000, 40000], [70000, 80000]])
+
+    def test_duplicates(self):
+        node = self._compare({'type': 'AND', 'children': [
+            self._condition(self.salary, 'gt', 10000),
+            self._condition(self.salary, 'gt', 10000),
+            self._condition(self.salary, 'lt', 90000),
+            self._condition(self.first_name, 'icontains', 'robert'),
+        ]})
+        self.assertEqual(len(node.children), 3)
+
+        # the NOT NULL primary key condition is only included once
+        lookups = [x[0] for x in node.condition.children]
+        self.assertEqual(len(lookups), len(set(lookups)))
+
+    def test_dedupe_values(self):
+        # lists are compared by their values rather than their
+        # representation, which is the same for large lists of the same size
+        condition = logictree.dedupe_condition(Q(
+            ('id__in', translators.LargeInList([1, 2, 3])),
+            ('id__in', translators.LargeInList([4, 5, 6])),
+            ('id__in', translators.LargeInList([1, 2, 3])),
+            ('id__in', [1, 2, 3]),
+            ('id__in', [1, 2, 3]),
+            ('id__exact', 1),
+            ('id__exact', True),
+        ))
+        values = [x[1] for x in condition.children]
+        self.assertEqual([list(x) for x in values[:2]], [[1, 2, 3],
+            [4, 5, 6]])
+        self.assertEqual(values[2:], [[1, 2, 3], 1, True])
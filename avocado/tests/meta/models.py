@@ -1,8 +1,13 @@
 from django.test import TestCase
+from django.utils import unittest
 from django.core.management import call_command
-from avocado.meta.models import Definition
+from avocado.meta.models import Definition, Domain
+from avocado.meta import utils
+from avocado.meta.cache import metadata, query_strings
+from avocado.tests.models import Title
 
-__all__ = ('DefinitionTestCase', 'ConceptTestCase', 'DomainTestCase')
+__all__ = ('DefinitionTestCase', 'DistributionTestCase', 'ConceptTestCase',
+    'DomainTestCase')
 
 class DefinitionTestCase(TestCase):
 
@@ -45,6 +50,223 @@ class DefinitionTestCase(TestCase):
         trans = d.translate(value='Robert')
         self.assertEqual(str(trans['condition']), "(AND: ('first_name__exact', u'Robert'), ('id__isnull', False))")
 
+    def test_metadata(self):
+        d1 = Definition.objects.get_by_natural_key('tests', 'title', 'salary')
+        d2 = Definition.objects.get_by_natural_key('tests', 'title', 'salary')
+
+        # resolved once and shared across instances
+        self.assertTrue(d1.metadata is d2.metadata)
+        self.assertEqual(d1.metadata.internal_type, 'integer')
+        self.assertEqual(d1.metadata.form_class.__name__, 'FloatField')
+
+        d1.save()
+        self.assertFalse(d1.natural_key() in metadata)
+
+        # the cache is process-wide, so it is cleared to only contain the
+        # definitions warmed here
+        metadata.invalidate()
+        metadata.warm()
+        self.assertTrue(d1.natural_key() in metadata)
+        self.assertEqual(len(metadata), Definition.objects.count())
+
+    def test_metadata_request_started(self):
+        from django.core.signals import request_started
+        from avocado.meta.models import warm_metadata
+
+        # in case a request was already handled by this process
+        request_started.connect(warm_metadata)
+        metadata.invalidate()
+
+        # warmed once by the first request
+        request_started.send(sender=self.__class__)
+        self.assertEqual(len(metadata), Definition.objects.count())
+
+        metadata.invalidate()
+        request_started.send(sender=self.__class__)
+        self.assertEqual(len(metadata), 0)
+
+    def test_sync(self):
+        # a single query to check the existing definitions
+        with self.assertNumQueries(1):
+            call_command('avocado', 'sync', 'tests', verbosity=0)
+
+        Definition.objects.all().delete()
+
+        call_command('avocado', 'sync', 'tests', create_domains=True,
+            dry_run=True, verbosity=0)
+        self.assertEqual(Definition.objects.count(), 0)
+        self.assertEqual(Domain.objects.count(), 0)
+
+        # existing definitions and domains, the domain order, domains and
+        # definitions inserts
+        with self.assertNumQueries(5):
+            call_command('avocado', 'sync', 'tests', create_domains=True,
+                verbosity=0)
+
+        self.assertEqual(Domain.objects.count(), 5)
+        self.assertEqual(list(Domain.objects.order_by('_order')\
+            .values_list('_order', flat=True)), range(5))
+        self.assertTrue(Definition.objects.get_by_natural_key('tests',
+            'title', 'salary'))
+
+    def test_unpublish_orphaned(self):
+        d = Definition(app_name='tests', model_name='employee',
+            field_name='middle_name', name='Middle Name', published=True)
+        d.save()
+
+        call_command('avocado', 'orphaned', unpublish=True, verbosity=0)
+        self.assertFalse(Definition.objects.get(pk=d.pk).published)
+
+        # the models have not changed since the last run
+        Definition.objects.filter(pk=d.pk).update(published=True)
+        call_command('avocado', 'orphaned', unpublish=True, since=True,
+            verbosity=0)
+        self.assertTrue(Definition.objects.get(pk=d.pk).published)
+
+    def test_fingerprints(self):
+        d = Definition.objects.get_by_natural_key('tests', 'title', 'salary')
+        self.assertEqual(d.fingerprint, d.metadata.fingerprint)
+
+        Definition.objects.filter(pk=d.pk).update(fingerprint='0' * 40)
+        call_command('avocado', 'fingerprints', update=True, verbosity=0)
+
+        d = Definition.objects.get(pk=d.pk)
+        self.assertEqual(d.fingerprint, d.metadata.fingerprint)
+
+    def test_query_string(self):
+        d = Definition.objects.get_by_natural_key('tests', 'title', 'salary')
+        query_strings.clear()
+        hits = query_strings.stats['hits']
+
+        self.assertEqual(d.query_string('exact'), 'title__salary__exact')
+        self.assertEqual(d.query_string('exact'), 'title__salary__exact')
+        self.assertEqual(query_strings.stats['hits'], hits + 1)
+
+    def test_choices(self):
+        for name in ('Programmer', 'Project Manager', 'Analyst'):
+            Title(name=name).save()
+
+        d = Definition.objects.get_by_natural_key('tests', 'title', 'name')
+        d.enable_choices = True
+        d.save()
+
+        # still a lazy queryset
+        self.assertEqual(d.values.count(), 3)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(d.choices_index.values, ('Analyst',
+                'Programmer', 'Project Manager'))
+
+        # cached for the forms and validation
+        with self.assertNumQueries(0):
+            d.formfield()
+            self.assertEqual(d.choices_index.page(2, per_page=2),
+                (('Project Manager', u'Project Manager'),))
+            self.assertEqual(d.choices_index.search('pro', limit=1),
+                (('Programmer', u'Programmer'),))
+
+        Title(name='Architect').save()
+        self.assertEqual(len(d.choices_index), 3)
+        self.assertEqual(len(d.refresh_choices()), 4)
+
+        # definitions without choices are not indexed
+        d = Definition.objects.get_by_natural_key('tests', 'employee',
+            'first_name')
+        with self.assertNumQueries(0):
+            self.assertEqual(d.choices_index, None)
+
+    def test_orphaned(self):
+        d = Definition(app_name='tests', model_name='employee',
+            field_name='middle_name')
+
+        self.assertTrue(d.model)
+        self.assertEqual(d.field, None)
+        self.assertEqual(d.datatype, None)
+
+
+class DistributionTestCase(TestCase):
+    def setUp(self):
+        call_command('avocado', 'sync', 'tests', verbosity=0)
+
+        for i, salary in enumerate([None, 10000, 10000, 15000, 20000, 35000]):
+            Title(name='Title %d' % i, salary=salary).save()
+
+    def test_stored(self):
+        d = Definition.objects.get_by_natural_key('tests', 'title', 'salary')
+        live = d.distribution(stored=False)
+
+        # not stored yet
+        self.assertEqual(d.distribution(), live)
+
+        call_command('avocado', 'distributions', 'tests.title', verbosity=0)
+        self.assertEqual(d.stored_distribution.values.count(), 5)
+
+        with self.assertNumQueries(2):
+            self.assertEqual(d.distribution(), live)
+
+        self.assertEqual(d.distribution(exclude=[None], min_count=2),
+            d.distribution(exclude=[None], min_count=2, stored=False))
+        self.assertEqual(d.distribution(order_by='count'),
+            d.distribution(order_by='count', stored=False))
+
+        # without numpy, fixed width bins are computed from the source table
+        previous = utils.numpy
+        utils.numpy = None
+        try:
+            self.assertEqual(d.distribution(bins='fixed', max_points=2),
+                ((10000.0, 4), (22500.0, 1)))
+        finally:
+            utils.numpy = previous
+
+    def test_refresh(self):
+        d = Definition.objects.get_by_natural_key('tests', 'title', 'name')
+        d.refresh_distribution()
+
+        Title(name='Title 0', salary=5000).save()
+        d.refresh_distribution()
+
+        self.assertEqual(d.distribution(), d.distribution(stored=False))
+
+    @unittest.skipIf(utils.numpy is None, 'requires numpy')
+    def test_vectorized(self):
+        d = Definition.objects.get_by_natural_key('tests', 'title', 'salary')
+        dist = [(i, i % 97 + 1) for i in range(5000)]
+
+        for smooth in (0, 0.01, 0.5):
+            for max_points in (None, 20):
+                self.assertEqual(
+                    utils._sample_python(d, list(dist), smooth, max_points),
+                    utils._sample_numpy(d, list(dist), smooth, max_points))
+
+    def test_binned(self):
+        d = Definition.objects.get_by_natural_key('tests', 'title', 'salary')
+
+        # grouped by bucket in the database
+        with self.assertNumQueries(2):
+            self.assertEqual(d.distribution(bins='fixed', max_points=2,
+                stored=False), ((10000.0, 4), (22500.0, 1)))
+
+        self.assertEqual(d.distribution(bins='fixed', max_points=2,
+            exclude=[10000]), ((15000.0, 2), (25000.0, 1)))
+
+    @unittest.skipIf(utils.numpy is None, 'requires numpy')
+    def test_binned_python(self):
+        # ``min_count`` is only supported by the Python binning which must
+        # produce the same bins as the database
+        d = Definition.objects.get_by_natural_key('tests', 'title', 'salary')
+        self.assertEqual(d.distribution(bins='fixed', max_points=2,
+            min_count=1, stored=False), d.distribution(bins='fixed',
+            max_points=2, stored=False))
+
+    @unittest.skipIf(utils.numpy is None, 'requires numpy')
+    def test_bins(self):
+        d = Definition.objects.get_by_natural_key('tests', 'title', 'salary')
+
+        self.assertEqual(d.distribution(bins='fixed', max_points=2),
+            ((10000.0, 4), (22500.0, 1)))
+        self.assertEqual(d.distribution(bins='quantile', max_points=2),
+            ((10000.0, 3), (20000.0, 2)))
+
 
 class ConceptTestCase(TestCase):
     pass
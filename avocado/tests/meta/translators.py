@@ -1,6 +1,171 @@
+from datetime import date, datetime
+from django.db import connection
 from django.test import TestCase
+from django.utils import unittest
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from avocado.meta import translators
+from avocado.meta.models import Definition
+from avocado.tests.models import Office, Employee, Meeting
 
 __all__ = ('TranslatorTestCase',)
 
 class TranslatorTestCase(TestCase):
-    pass
+    def setUp(self):
+        call_command('avocado', 'sync', 'tests', verbosity=0)
+
+    def test_operator(self):
+        d = Definition.objects.get_by_natural_key('tests', 'title', 'salary')
+        trans = translators.registry[d.translator]
+
+        self.assertEqual(trans._validate_operator(d, None).uid, 'exact')
+        self.assertEqual(trans._validate_operator(d, '-isnull').uid, '-isnull')
+        self.assertRaises(translators.OperatorNotPermitted,
+            trans._validate_operator, d, 'icontains')
+        self.assertRaises(ValueError, trans._validate_operator, d, 'foo')
+
+    def test_translate_many(self):
+        salary = Definition.objects.get_by_natural_key('tests', 'title', 'salary')
+        name = Definition.objects.get_by_natural_key('tests', 'employee', 'first_name')
+
+        conditions = [(salary, 'gt', '1000'), (name, 'exact', 'Robert'),
+            (salary, 'gt', '2000'), (salary, 'in', [1, None])]
+
+        metas = translators.translate_many(conditions)
+        self.assertEqual([str(m['condition']) for m in metas],
+            [str(d.translate(o, v)['condition']) for d, o, v in conditions])
+
+        self.assertEqual(len(salary.translate_many([('exact', 1), ('lt', 5)])), 2)
+        self.assertRaises(ValidationError, translators.translate_many,
+            [(salary, 'range', 1)])
+
+    def test_translate_many_hooks(self):
+        class Translator(translators.Translator):
+            def _validate_value(self, definition, value, **kwargs):
+                value = super(Translator, self)._validate_value(definition,
+                    value, **kwargs)
+                return value * 2
+
+            def _condition(self, definition, operator, value, using):
+                return super(Translator, self)._condition(definition,
+                    operator, value + 1, using)
+
+        trans = Translator()
+        salary = Definition.objects.get_by_natural_key('tests', 'title', 'salary')
+        conditions = [(salary, 'gt', '1000'), (salary, 'lt', '2000')]
+
+        metas = trans.translate_many(conditions)
+        self.assertEqual(metas[0]['cleaned_data']['value'], 2000)
+        self.assertEqual([str(m['condition']) for m in metas],
+            [str(trans.translate(d, o, v, None)['condition'])
+                for d, o, v in conditions])
+
+    def test_large_in_list(self):
+        office = Office.objects.create(location='Philadelphia')
+        for name in ('Robert', 'Mary', 'Zoe'):
+            Employee(first_name=name, last_name='Smith', office=office).save()
+
+        d = Definition.objects.get_by_natural_key('tests', 'employee', 'first_name')
+        values = ['Robert', 'Mary'] + ['Name %d' % i for i in range(20)]
+
+        threshold = translators.LARGE_IN_LIST_THRESHOLD
+        translators.LARGE_IN_LIST_THRESHOLD = 10
+
+        try:
+            for operator, count in (('in', 2), ('-in', 1)):
+                condition = d.translate(operator, values)['condition']
+                self.assertEqual(Employee.objects.filter(condition).count(), count)
+        finally:
+            translators.LARGE_IN_LIST_THRESHOLD = threshold
+
+    @unittest.skipIf(connection.vendor != 'postgresql', 'requires PostgreSQL')
+    def test_large_in_list_unnest(self):
+        office = Office.objects.create(location='Philadelphia')
+        for name in ('Robert', 'Mary', 'Zoe'):
+            Employee(first_name=name, last_name='Smith', office=office).save()
+
+        d = Definition.objects.get_by_natural_key('tests', 'employee', 'first_name')
+        values = ['Robert', 'Mary'] + ['Name %d' % i for i in range(20)]
+
+        threshold = translators.LARGE_IN_LIST_THRESHOLD
+        translators.LARGE_IN_LIST_THRESHOLD = 10
+
+        try:
+            condition = d.translate('in', values)['condition']
+        finally:
+            translators.LARGE_IN_LIST_THRESHOLD = threshold
+
+        queryset = Employee.objects.filter(condition)
+        self.assertTrue('unnest' in str(queryset.query))
+        self.assertEqual(queryset.count(), 2)
+
+    @unittest.skipIf(connection.vendor != 'sqlite' or
+        not translators._has_json_each(), 'requires SQLite 3.38 or later')
+    def test_large_in_list_json_each(self):
+        office = Office.objects.create(location='Philadelphia')
+        for name in ('Robert', 'Mary', 'Zoe'):
+            Employee(first_name=name, last_name='Smith', office=office).save()
+
+        # more values than the maximum number of parameters SQLite supports
+        d = Definition.objects.get_by_natural_key('tests', 'employee', 'first_name')
+        values = ['Robert', 'Mary'] + ['Name %d' % i for i in range(40000)]
+
+        for operator, count in (('in', 2), ('-in', 1)):
+            condition = d.translate(operator, values)['condition']
+            queryset = Employee.objects.filter(condition)
+            self.assertTrue('json_each' in str(queryset.query))
+            self.assertEqual(queryset.count(), count)
+
+        # datetimes are compared as they are stored by the backend
+        Meeting(office=office, start_time=datetime(2012, 1, 1, 9)).save()
+        values = [datetime(2012, 1, 1, 9), datetime(2012, 1, 1, 9, 0, 1)]
+
+        self.assertEqual(Meeting.objects.filter(
+            start_time__in=translators.LargeInList(values)).count(), 1)
+
+    def test_validator(self):
+        d = Definition.objects.get_by_natural_key('tests', 'title', 'salary')
+        trans = translators.registry[d.translator]
+
+        validator = trans.get_validator(d)
+        self.assertTrue(validator is trans.get_validator(d))
+
+        self.assertEqual(validator(['50000', None]), [50000.0, None])
+        self.assertRaises(ValidationError, validator, 'foo')
+
+        # the formfield is still built for custom arguments
+        self.assertEqual(trans._validate_value(d, '1', required=False), 1.0)
+
+    def test_coercion(self):
+        get = Definition.objects.get_by_natural_key
+        trans = translators.registry[None]
+
+        definitions = [get('tests', 'title', 'salary'),
+            get('tests', 'employee', 'first_name'),
+            get('tests', 'employee', 'is_manager'),
+            get('tests', 'project', 'due_date')]
+
+        # the common datatypes are cleaned without building formfields
+        for d in definitions:
+            d.field.formfield = lambda **kwargs: self.fail('formfield built')
+
+        try:
+            salary, name, is_manager, due_date = [trans.get_validator(d)
+                for d in definitions]
+
+            self.assertEqual(salary(' 10 '), 10.0)
+            self.assertEqual(salary(''), None)
+
+            self.assertEqual(name(10), u'10')
+            self.assertRaises(ValidationError, name, '')
+            self.assertRaises(ValidationError, name, 'x' * 51)
+
+            self.assertEqual(is_manager('False'), False)
+            self.assertEqual(is_manager('1'), True)
+            self.assertEqual(is_manager('foo'), None)
+
+            self.assertEqual(due_date('2012-01-31'), date(2012, 1, 31))
+            self.assertRaises(ValidationError, due_date, '2012-31-01')
+        finally:
+            for d in definitions:
+                del d.field.formfield
@@ -0,0 +1,86 @@
+import sys
+from django.test import TestCase
+from avocado.utils import loader
+
+__all__ = ('RegistryTestCase', 'LazyImportTestCase')
+
+class Default(object):
+    pass
+
+
+class RegistryTestCase(TestCase):
+    def test_lazy(self):
+        registry = loader.Registry(default=Default, module_name='exporters')
+
+        # nothing is imported until the first lookup
+        self.assertFalse(registry.discovered)
+        self.assertEqual(registry.stats['modules'], 0)
+
+        self.assertTrue(isinstance(registry['foo'], Default))
+        self.assertTrue(registry.discovered)
+        self.assertTrue(registry.stats['modules'] > 0)
+
+    def test_lazy_choices(self):
+        class First(object):
+            pass
+
+        class Second(object):
+            pass
+
+        registry = loader.Registry(default=Default, module_name='exporters')
+        registry.register(First, 'first')
+        choices = registry.lazy_choices
+
+        self.assertFalse(registry.discovered)
+        self.assertEqual(list(choices), [('first', 'first')])
+        self.assertTrue(registry.discovered)
+
+        # classes registered later are included
+        registry.register(Second, 'second')
+        self.assertEqual(list(choices), [('first', 'first'),
+            ('second', 'second')])
+
+    def test_failed_discovery(self):
+        def autodiscover(module_name):
+            raise ImportError('broken module')
+
+        registry = loader.Registry(default=Default, module_name='exporters')
+        original = loader.autodiscover
+        loader.autodiscover = autodiscover
+
+        try:
+            self.assertRaises(ImportError, registry.__getitem__, 'foo')
+            # still not discovered, so the error is raised again rather
+            # than silently returning the default
+            self.assertFalse(registry.discovered)
+            self.assertRaises(ImportError, registry.__getitem__, 'foo')
+        finally:
+            loader.autodiscover = original
+
+        self.assertTrue(isinstance(registry['foo'], Default))
+        self.assertTrue(registry.discovered)
+
+
+class LazyImportTestCase(TestCase):
+    def test_missing(self):
+        self.assertEqual(loader.lazy_import('avocado_missing_module'), None)
+
+    def test_lazy(self):
+        sys.modules.pop('colorsys', None)
+
+        colorsys = loader.lazy_import('colorsys')
+        self.assertTrue(isinstance(colorsys, loader.LazyModule))
+        self.assertFalse('colorsys' in sys.modules)
+
+        # imported on the first attribute access
+        self.assertEqual(colorsys.rgb_to_hsv(0, 0, 0), (0, 0, 0))
+        self.assertTrue('colorsys' in sys.modules)
+
+    def test_submodules(self):
+        sys.modules.pop('json.tool', None)
+
+        json = loader.lazy_import('json', 'json.tool')
+        self.assertFalse('json.tool' in sys.modules)
+
+        self.assertTrue(json.tool)
+        self.assertTrue('json.tool' in sys.modules)
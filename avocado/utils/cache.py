@@ -0,0 +1,87 @@
+import time
+import threading
+from collections import OrderedDict
+
+class LRUCache(object):
+    """A thread-safe in-memory least-recently-used cache with an optional
+    timeout per entry. Hits and misses are counted for monitoring.
+
+        ``maxsize`` - the maximum number of entries. the least recently used
+        entry is evicted when exceeded. ``None`` means unbounded
+
+        ``timeout`` - the default number of seconds an entry is valid for.
+        ``None`` means entries never expire
+    """
+    def __init__(self, maxsize=None, timeout=None):
+        self.maxsize = maxsize
+        self.timeout = timeout
+
+        self.hits = 0
+        self.misses = 0
+
+        self._data = OrderedDict()
+        self._lock = threading.RLock()
+
+    def __contains__(self, key):
+        with self._lock:
+            if key not in self._data:
+                return False
+            expires = self._data[key][0]
+            return expires is None or expires > time.time()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                expires, value = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+
+            if expires is not None and expires <= time.time():
+                self.misses += 1
+                return default
+
+            # re-insert to mark it as the most recently used
+            self._data[key] = (expires, value)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, timeout=None):
+        if timeout is None:
+            timeout = self.timeout
+
+        expires = None
+        if timeout is not None:
+            expires = time.time() + timeout
+
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (expires, value)
+
+            if self.maxsize is not None:
+                while len(self._data) > self.maxsize:
+                    self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def items(self):
+        "Returns a list of the (key, value) pairs, including expired entries."
+        with self._lock:
+            return [(k, v) for k, (e, v) in self._data.iteritems()]
+
+    @property
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._data),
+        }
@@ -29,3 +29,21 @@ def ins(value):
             pass
     return False
 
+
+def chunked(iterable, size):
+    """Returns a generator which yields lists of at most ``size`` items
+    from ``iterable``.
+
+    >>> list(chunked(range(5), 2))
+    [[0, 1], [2, 3], [4]]
+    >>> list(chunked([], 2))
+    []
+    """
+    chunk = []
+    for x in iterable:
+        chunk.append(x)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
@@ -1,5 +1,8 @@
+import time
+import pkgutil
 from django.conf import settings
 from django.utils.importlib import import_module
+from django.utils.module_loading import module_has_submodule
 from django.core.exceptions import ImproperlyConfigured
 
 class AlreadyRegistered(Exception):
@@ -10,21 +13,74 @@ class NotRegistered(Exception):
     pass
 
 
+class LazyChoices(object):
+    """An iterable of the choices of a registry which are only discovered
+    when iterated over. This can be used as the ``choices`` of a model field,
+    since the field is defined at import time. The choices are re-read each
+    time, so classes registered later are included.
+    """
+    def __init__(self, registry):
+        self.registry = registry
+
+    def __iter__(self):
+        return iter(self.registry.choices)
+
+
 class Registry(object):
     """Keeps track of registered classes along with named instances. Only one
     instance is created for a given class, so the instance should be stateless.
+
+    If ``module_name`` is supplied, the ``module_name`` module of each
+    installed app is discovered on the first lookup rather than when the
+    registry is created. The number of modules imported and the time taken
+    are available in ``stats``.
     """
-    def __init__(self, default=None):
+    def __init__(self, default=None, module_name=None):
         # store first default
         self._default = default() if default else None
 
-        self.default = self._default
+        self._current_default = self._default
 
         self._registry = {}
         self._objects = {}
 
+        self.module_name = module_name
+        self.discovered = module_name is None
+        self.stats = {'modules': 0, 'time': 0.0}
+
+    def _discover(self):
+        if self.discovered:
+            return
+
+        # set prior to discovery since the discovered modules register their
+        # classes with this registry
+        self.discovered = True
+
+        start = time.time()
+
+        # the errors raised by the discovered modules are not suppressed.
+        # discovery is retried on the next lookup rather than leaving the
+        # registry partially populated
+        try:
+            self.stats['modules'] = autodiscover(self.module_name)
+        except:
+            self.discovered = False
+            raise
+
+        self.stats['time'] = time.time() - start
+
+    @property
+    def default(self):
+        self._discover()
+        return self._current_default
+
     def __getitem__(self, name):
-        return self._objects.get(name, self.default)
+        self._discover()
+        return self._objects.get(name, self._current_default)
+
+    def __contains__(self, name):
+        self._discover()
+        return name in self._objects
 
     def register(self, klass, name=None):
         """Registers a class with an optional name. The class name will be used
@@ -40,12 +96,13 @@ class Registry(object):
 
             # ensure the default if already overriden is not being overriden
             # again.
-            if self.default and self.default is not self._default:
+            if self._current_default and \
+                self._current_default is not self._default:
                 raise ImproperlyConfigured('The default class cannot be set '
                     'more than once for this registry (%s was the default).' %
-                    self.default.__class__.__name__)
+                    self._current_default.__class__.__name__)
 
-            self.default = klass()
+            self._current_default = klass()
         else:
             if not name:
                 name = klass.__name__
@@ -61,6 +118,8 @@ class Registry(object):
         """Unregisters a class. Note that these calls must be made in
         INSTALLED_APPS listed after the apps that already registered the class.
         """
+        self._discover()
+
         if klass not in self._registry:
             raise NotRegistered('The class %s is not registered' %
                 klass.__name__)
@@ -70,17 +129,69 @@ class Registry(object):
     @property
     def choices(self):
         "Returns a 2-tuple list of all registered class instance names."
+        self._discover()
         return sorted((n, n) for n in self._registry.itervalues())
 
+    @property
+    def lazy_choices(self):
+        "Returns the ``choices`` which are discovered when iterated over."
+        return LazyChoices(self)
+
 
 def autodiscover(module_name):
     """Simple auto-discover for looking through each INSTALLED_APPS for each
-    ``module_name`` and fail silently when not found. This should be used for
-    modules that have 'registration' like behavior.
+    ``module_name``. This should be used for modules that have 'registration'
+    like behavior. Only modules which exist are imported, so errors raised
+    while importing them are not hidden. Returns the number of modules
+    imported.
     """
+    count = 0
+
     for app in settings.INSTALLED_APPS:
-        # Attempt to import the app's ``module_name``.
-        try:
+        mod = import_module(app)
+
+        # check the module exists prior to importing it
+        if module_has_submodule(mod, module_name):
             import_module('%s.%s' % (app, module_name))
-        except:
-            pass
+            count += 1
+
+    return count
+
+
+class LazyModule(object):
+    """A proxy for a module which is imported on the first attribute access.
+    ``submodules`` are imported along with it, e.g. ``pyarrow.parquet``.
+    """
+    def __init__(self, name, *submodules):
+        self.__dict__.update({
+            '_name': name,
+            '_submodules': submodules,
+            '_module': None,
+        })
+
+    def _load(self):
+        if self._module is None:
+            module = import_module(self._name)
+            for name in self._submodules:
+                import_module(name)
+            self.__dict__['_module'] = module
+        return self._module
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+    def __repr__(self):
+        return '<LazyModule: %s>' % self._name
+
+
+def lazy_import(name, *submodules):
+    """Returns a ``LazyModule`` for the top-level module ``name`` if it is
+    installed, otherwise ``None``. The module is located, but not imported,
+    which keeps optional dependencies out of the startup cost.
+    """
+    try:
+        if pkgutil.find_loader(name) is None:
+            return
+    except ImportError:
+        return
+    return LazyModule(name, *submodules)
@@ -0,0 +1,76 @@
+"""Measures the startup cost of Avocado. Only the standard library is
+imported at the top of this module so the measurements are not skewed. The
+results are only meaningful in a fresh interpreter, which is why the
+``profile_startup`` command runs ``main`` in a subprocess.
+"""
+import sys
+import json
+import time
+
+# the modules in the order they are imported. the cost of each module is
+# marginal, i.e. it excludes the modules imported before it
+MODULES = [
+    'django.db.models',
+    'django.forms',
+    'django.http',
+    'modeltree.tree',
+    'avocado.conf',
+    'avocado.meta.operators',
+    'avocado.meta.translators',
+    'avocado.meta.formatters',
+    'avocado.meta.models',
+    'avocado.meta.logictree',
+    'avocado.meta.exporters',
+]
+
+def time_imports(modules):
+    """Imports each module in order and returns a list of tuples containing
+    the module name, the elapsed time and the number of modules loaded as a
+    side effect.
+    """
+    results = []
+
+    for name in modules:
+        loaded = len(sys.modules)
+
+        start = time.time()
+        __import__(name)
+        elapsed = time.time() - start
+
+        results.append((name, elapsed, len(sys.modules) - loaded))
+
+    return results
+
+
+def registry_stats():
+    """Forces the discovery of each registry and returns a list of tuples
+    containing the registry name, the discovery time and the number of app
+    modules imported.
+    """
+    from avocado.meta import translators, formatters, exporters
+
+    results = []
+
+    for name, module in (('translators', translators),
+        ('formatters', formatters), ('exporters', exporters)):
+
+        registry = module.registry
+        registry.choices
+        results.append((name, registry.stats['time'],
+            registry.stats['modules']))
+
+    return results
+
+
+def main(modules=None):
+    "Writes the import and registry discovery costs to stdout as JSON."
+    start = time.time()
+    imports = time_imports(modules or MODULES)
+    registries = registry_stats()
+
+    json.dump({
+        'imports': imports,
+        'registries': registries,
+        'total': time.time() - start,
+        'modules': len(sys.modules),
+    }, sys.stdout)